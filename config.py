@@ -10,9 +10,24 @@
 # ============================================================================
 
 EMAIL_FETCH_INTERVAL = 15  # Seconds between inbox checks
-TOKEN_FILE = "token.pickle"
+TOKEN_FILE = "token.json"           # Gmail OAuth token (written by gmail_auth.py)
+LEGACY_TOKEN_FILE = "token.pickle"  # Old pickled token, converted to TOKEN_FILE on first use
+HISTORY_ID_FILE = "history_id.txt"  # Last synced Gmail history ID (resume point)
+RETRY_IDS_FILE = "retry_message_ids.txt"  # Leads that failed or could not be fetched, retried with backoff
+LEAD_RETRY_LIMIT = 8  # Attempts at a failing lead before it is given up
+LEAD_RETRY_BASE_DELAY = 60  # Seconds before the first retry of a failed lead (doubles per attempt)
+LEAD_RETRY_MAX_DELAY = 3600  # Longest wait between retries of a lead (8 attempts span about 2 hours)
+GMAIL_BATCH_SIZE = 50  # Messages fetched per batched HTTP request (Gmail recommends <= 50)
+PIPELINE_WORKERS = 4  # Leads processed in parallel (Groq calls are still capped by GROQ_MAX_CONCURRENT)
 OUTPUT_CSV = "qualified_leads.csv"
 
+# Optional Gmail push notifications via Cloud Pub/Sub (needs google-cloud-pubsub).
+# Leave empty to poll every EMAIL_FETCH_INTERVAL seconds.
+GMAIL_PUBSUB_TOPIC = ""         # e.g. "projects/my-project/topics/gmail-notify"
+GMAIL_PUBSUB_SUBSCRIPTION = ""  # e.g. "projects/my-project/subscriptions/gmail-notify-sub"
+PUSH_FALLBACK_INTERVAL = 300    # With push enabled: seconds between safety-net checks
+GMAIL_WATCH_RENEW_INTERVAL = 6 * 24 * 3600  # Gmail watches expire after 7 days
+
 # Keywords that trigger lead qualification
 # Add or remove keywords to match your business needs
 KEYWORDS = [
@@ -21,6 +36,13 @@ KEYWORDS = [
     "booklet", "information pack", "document", "presentation"
 ]
 
+# Free email providers: senders on these domains have no company website,
+# so their email domain is never used as a fallback website.
+# Matched against each label of the domain (yahoo.co.uk -> "yahoo")
+FREE_EMAIL_PROVIDERS = frozenset({
+    "gmail", "yahoo", "outlook", "hotmail"
+})
+
 # System email domains to ignore (no-reply, automation, etc.)
 SYSTEM_EMAIL_DOMAINS = [
     "google.com", "microsoft.com", "outlook.com", "apple.com",
@@ -33,6 +55,16 @@ SYSTEM_EMAIL_DOMAINS = [
     "mail.google.com", "mail.office.com"
 ]
 
+# Derived lookups, built once at import (do not edit):
+# bare domains match the sender's domain or any parent domain,
+# "name@" entries match the end of the sender's mailbox name
+SYSTEM_EMAIL_DOMAINS_SET = frozenset(
+    d.lower() for d in SYSTEM_EMAIL_DOMAINS if not d.endswith("@")
+)
+SYSTEM_EMAIL_MAILBOXES = tuple(
+    d.lower()[:-1] for d in SYSTEM_EMAIL_DOMAINS if d.endswith("@")
+)
+
 # System email keywords to ignore
 SYSTEM_EMAIL_KEYWORDS = [
     "do not reply", "don't reply", "donotreply", "no-reply",
@@ -55,9 +87,14 @@ SYSTEM_EMAIL_KEYWORDS = [
 
 TEMPLATE_FILE = "template.docx"  # Your customizable template
 SCRAPED_DIR = "scraped_sites"    # Cached website content
+SCRAPE_CACHE_TTL = 7 * 24 * 3600  # Seconds before cached site content/summaries expire
 PERSONALISED_DIR = "personalised"  # Generated documents
 MASTER_LOG = "master_log.txt"    # Activity log
 FAILED_LOG = "failed_steps.txt"  # Error log
+LOG_FLUSH_EVERY = 50       # Write log file at least every this many messages
+LOG_MAX_BYTES = 5_000_000  # Rotate log files at this size
+LOG_BACKUP_COUNT = 3       # Rotated log files to keep
+LOG_LEVEL = "INFO"         # DEBUG, INFO, WARNING, ERROR
 
 # ============================================================================
 # AI & GROQ CONFIGURATION
@@ -66,10 +103,24 @@ FAILED_LOG = "failed_steps.txt"  # Error log
 GROQ_MODEL = "llama-3.1-8b-instant"  # AI model to use
 GROQ_MAX_TOKENS = 600  # Maximum response length
 GROQ_TEMPERATURE = 0.3  # Determinism (0.0 = deterministic, 1.0 = creative)
+GROQ_SHORT_MAX_TOKENS = 64  # Cap for one-line answers (company name, description)
+GROQ_BLURBS_MAX_TOKENS = 400  # Cap for the numbered blurb list
+GROQ_EXTRACT_TEMPERATURE = 0.0  # Extraction calls should be deterministic
+GROQ_HTTP_TIMEOUT = 30.0  # Seconds per Groq API request
+GROQ_MAX_CONNECTIONS = 20  # Pooled keep-alive connections to the Groq API
+GROQ_MAX_CONCURRENT = 4  # Groq requests allowed in flight at once (rate-limit guard)
+GROQ_MAX_RETRIES = 5  # SDK retries on rate limits/5xx/connection errors (SDK default: 2)
+SUMMARY_MAX_CHARS = 4000  # Website content sent for summarization (cut at a word boundary)
+GROQ_CACHE_FILE = "groq_cache.db"  # On-disk cache of Groq responses (SQLite)
+GROQ_CACHE_TTL = 30 * 24 * 3600  # Seconds before a cached Groq response expires
+GROQ_MEMORY_CACHE_SIZE = 512  # In-process cache entries kept on top of disk
 
 # ============================================================================
 # AI PROMPTS - Customize to change AI behavior
 # ============================================================================
+# Keep the {placeholders} at the END of each prompt: everything above the
+# first placeholder line is sent as a fixed system message (a byte-identical
+# prefix the provider can cache), the rest as the user message.
 
 EXTRACT_COMPANY_PROMPT = """
 Extract the exact company name from this webpage summary. Respond with ONLY the company name (e.g., 'Acme Corporation'), nothing else.
@@ -84,9 +135,9 @@ Summary: {summary}
 """
 
 GENERATE_BLURBS_PROMPT = """
-Generate 5 short, personalized blurbs (1-2 sentences each) for our organization's services. Explain how EACH of our services can specifically benefit {company_name} based on their focus in this summary: {summary}.
+Generate 5 short, personalized blurbs (1-2 sentences each) for our organization's services. Explain how EACH of our services can specifically benefit the company named below, based on its focus in the summary below.
 
-Use the perspective of our organization offering help TO {company_name} (e.g., 'We can optimize your workflows to enhance your digital efficiency').
+Use the perspective of our organization offering help TO that company (e.g., 'We can optimize your workflows to enhance your digital efficiency').
 
 Keep each professional, concise, and starting with 'We can' or similar. Number them exactly 1-5, one per line—no extras or markdown:
 
@@ -95,6 +146,28 @@ Keep each professional, concise, and starting with 'We can' or similar. Number t
 3. Custom Solution Development
 4. Training & Knowledge Transfer
 5. Quality Assurance & Performance Monitoring
+
+Company: {company_name}
+Summary: {summary}
+"""
+
+COMBINED_EXTRACTION_PROMPT = """
+From this webpage summary, extract the company details and write personalized blurbs for our organization's services. Respond with ONLY a JSON object in exactly this shape, nothing else:
+
+{{"company": "...", "description": "...", "blurbs": ["...", "...", "...", "...", "..."]}}
+
+- "company": the exact company name (e.g., 'Acme Corporation')
+- "description": a concise one-sentence description of what the company does or deals with, phrased as 'providing [services] to [industries/clients]'
+- "blurbs": 5 short, personalized blurbs (1-2 sentences each) explaining how EACH of our services can specifically benefit the company, in this order:
+  1. Process Optimization & Workflow Analysis
+  2. Strategic Consulting & Planning
+  3. Custom Solution Development
+  4. Training & Knowledge Transfer
+  5. Quality Assurance & Performance Monitoring
+
+Write the blurbs from the perspective of our organization offering help TO the company (e.g., 'We can optimize your workflows to enhance your digital efficiency'). Keep each professional, concise, and starting with 'We can' or similar—no numbering or markdown.
+
+Summary: {summary}
 """
 
 SUMMARY_PROMPT = """
@@ -109,6 +182,14 @@ Keep it professional, concise, and factual. Do NOT use any markdown (like **bold
 Content: {content}
 """
 
+# ============================================================================
+# RETRIES (transient network and service failures)
+# ============================================================================
+
+RETRY_ATTEMPTS = 3  # Tries per Telegram/LibreOffice call before giving up
+RETRY_BASE_DELAY = 1.0  # Seconds before the first retry (doubles each time, randomized)
+RETRY_MAX_DELAY = 10.0  # Upper bound for a single retry delay
+
 # ============================================================================
 # TELEGRAM CONFIGURATION (Optional)
 # ============================================================================
@@ -123,4 +204,19 @@ TELEGRAM_MAX_MESSAGE_LENGTH = 4096  # Telegram's limit
 # ============================================================================
 
 EMAIL_SUBJECT = "Professional Solutions for Your Organization"  # Reply subject
+PDF_CONVERT_TIMEOUT = 90  # Seconds LibreOffice gets per conversion (a cold start is slow)
+
+# Reply email body ({recipient_name} is filled in per lead)
+EMAIL_REPLY_BODY = """Hello {recipient_name},
+
+Thank you for reaching out to us. We have reviewed your inquiry and are pleased to send you our personalized document, which outlines our services and how we can assist your organization.
+
+Please find attached a detailed overview of our offerings tailored to your needs. We are confident that our solutions will provide significant value to your organization.
+
+We would welcome the opportunity to discuss how we can support your business objectives. Please do not hesitate to contact us if you have any questions or would like to schedule a consultation.
+
+Best regards,
+Our Team
+"""
+
 DEFAULT_COMPANY_NAME = "Our Organization"  # Fallback name
\ No newline at end of file
@@ -6,34 +6,19 @@
 # ============================================================================
 
 import os
-import pickle
-from datetime import datetime
 from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from config import TOKEN_FILE
+from modules.email_handler import load_saved_credentials, save_credentials, build_gmail_service
+from modules.logger import log_message
 
 # Configuration
 CREDENTIALS_FILE = "credentials.json"
-TOKEN_FILE = "token.pickle"
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
-MASTER_LOG = "master_log.txt"
-
-def log_message(message: str, log_file: str = MASTER_LOG):
-    """Log to both console and file with timestamp."""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"[{timestamp}] {message}\n"
-    print(message)
-    with open(log_file, 'a', encoding='utf-8') as logf:
-        logf.write(log_entry)
 
 def authenticate_gmail():
     """Authenticate with Gmail API via OAuth 2.0 and return a Gmail service."""
-    creds = None
-
-    if os.path.exists(TOKEN_FILE):
-        with open(TOKEN_FILE, 'rb') as token:
-            creds = pickle.load(token)
+    creds = load_saved_credentials()
 
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
@@ -45,10 +30,9 @@ def authenticate_gmail():
             flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
             creds = flow.run_local_server(port=0)
 
-        with open(TOKEN_FILE, 'wb') as token:
-            pickle.dump(creds, token)
+        save_credentials(creds)
 
-    return build('gmail', 'v1', credentials=creds)
+    return build_gmail_service(creds)
 
 def main():
     """Run Gmail authentication only."""
@@ -4,55 +4,79 @@
 # Primary entry point for the email monitoring and automation system
 # ============================================================================
 
+import io
 import os
 import time
+import logging
+import threading
 import traceback
-from datetime import datetime
-from groq import Groq
+from typing import Optional
+from html import escape
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 
-from config import EMAIL_FETCH_INTERVAL, MASTER_LOG, FAILED_LOG
-from modules.email_handler import authenticate_gmail, fetch_latest_email, validate_email
-from modules.web_scraper import scrape_website
+from googleapiclient.http import MediaIoBaseUpload
+from config import (
+    EMAIL_FETCH_INTERVAL, PUSH_FALLBACK_INTERVAL, GMAIL_WATCH_RENEW_INTERVAL,
+    PIPELINE_WORKERS, LEAD_RETRY_LIMIT, LEAD_RETRY_BASE_DELAY, LEAD_RETRY_MAX_DELAY,
+    MASTER_LOG, FAILED_LOG, EMAIL_REPLY_BODY
+)
+from modules.email_handler import (
+    authenticate_gmail, fetch_emails, validate_email,
+    get_current_history_id, fetch_new_message_ids, load_history_id, save_history_id,
+    load_retry_message_ids, save_retry_message_ids
+)
+from modules.web_scraper import scrape_website, load_cached_summary, save_cached_summary
 from modules.ai_processor import (
-    test_groq_connection, summarize_with_groq, 
-    extract_company_name, extract_company_description, generate_blurbs
+    create_groq_client, test_groq_connection, summarize_with_groq, extract_company_details
 )
 from modules.document_generator import generate_personalized_document, convert_docx_to_pdf
-from modules.csv_manager import init_csv, add_or_update_lead, mark_as_done
+from modules.csv_manager import (
+    init_csv, add_or_update_lead, mark_as_done, get_processed_message_ids,
+    get_lead_pdf, set_lead_pdf
+)
+from modules.reply_message import build_reply_message
+from modules.gmail_watcher import (
+    push_configured, start_gmail_watch, start_push_listener, describe_listener_stop
+)
+from modules.logger import (
+    log_message as write_log, format_timestamp, set_log_prefix, add_log_prefix
+)
 from modules.telegram_notifier import (
     send_telegram_document, add_to_telegram_buffer, 
     flush_telegram_buffer, start_telegram_buffer_thread
 )
 
+# Leads are independent, so several run through the pipeline at once
+pipeline_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS)
+
+# The Gmail client (httplib2) is not thread-safe; pipelines take turns sending
+gmail_send_lock = threading.Lock()
+
+# Message IDs that failed validation (validation is deterministic per message)
+rejected_message_ids = set()
+
 # ============================================================================
 # LOGGING UTILITIES
 # ============================================================================
 
 def log_message(message: str, log_file: str = MASTER_LOG):
     """Log to console, file, and Telegram buffer."""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"[{timestamp}] {message}\n"
-    print(message)
-    
-    with open(log_file, 'a', encoding='utf-8') as logf:
-        logf.write(log_entry)
+    write_log(message, log_file)
+    timestamp = format_timestamp()
     
     # Add to Telegram buffer (escape HTML special characters)
-    escaped_message = message.replace("<", "<").replace(">", ">").replace("&", "&")
+    escaped_message = escape(add_log_prefix(message), quote=False)
     add_to_telegram_buffer(f"[{timestamp}] {escaped_message}")
 
 def log_failure(step: str, error: str, log_file: str = FAILED_LOG):
     """Log failure to both file and Telegram."""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"[{timestamp}] FAILED STEP '{step}': {error}\n"
-    print(f"💥 {log_entry.strip()}")
-    
-    with open(log_file, 'a', encoding='utf-8') as logf:
-        logf.write(log_entry)
+    write_log(f"FAILED STEP '{step}': {error}", log_file, level=logging.ERROR)
+    timestamp = format_timestamp()
     
     # Telegram buffer
-    escaped_error = error.replace("<", "<").replace(">", ">").replace("&", "&")
-    add_to_telegram_buffer(f"💥 [{timestamp}] FAILED '{step}': {escaped_error}")
+    escaped_error = escape(error, quote=False)
+    add_to_telegram_buffer(add_log_prefix(f"💥 [{timestamp}] FAILED '{step}': {escaped_error}"))
 
 # ============================================================================
 # EMAIL REPLY FUNCTIONALITY
@@ -60,50 +84,29 @@ def log_failure(step: str, error: str, log_file: str = FAILED_LOG):
 
 def create_email_body(recipient_name: str) -> str:
     """Create professional email body for reply."""
-    return f"""Hello {recipient_name},
-
-Thank you for reaching out to us. We have reviewed your inquiry and are pleased to send you our personalized document, which outlines our services and how we can assist your organization.
-
-Please find attached a detailed overview of our offerings tailored to your needs. We are confident that our solutions will provide significant value to your organization.
-
-We would welcome the opportunity to discuss how we can support your business objectives. Please do not hesitate to contact us if you have any questions or would like to schedule a consultation.
-
-Best regards,
-Our Team
-"""
+    return EMAIL_REPLY_BODY.format(recipient_name=recipient_name)
 
 def send_reply_email(service, email_recipient: str, original_subject: str, 
-                    body: str, pdf_path: str, original_message_id: str) -> bool:
-    """Send reply email with PDF attachment."""
-    from email.mime.multipart import MIMEMultipart
-    from email.mime.text import MIMEText
-    from email.mime.base import MIMEBase
-    from email import encoders
-    import base64
-    
+                    body: str, pdf_path: str, original_message_id: str,
+                    pdf_data: Optional[bytes] = None) -> bool:
+    """Send reply email with PDF attachment (pdf_data skips re-reading pdf_path)."""
     try:
-        # Create message
-        message = MIMEMultipart()
-        message['to'] = email_recipient
-        message['subject'] = f"Re: {original_subject}"
+        if pdf_data is None and os.path.exists(pdf_path):
+            pdf_data = Path(pdf_path).read_bytes()
         
-        # Add body
-        message.attach(MIMEText(body, 'plain'))
-        
-        # Add attachment
-        if os.path.exists(pdf_path):
-            part = MIMEBase('application', 'octet-stream')
-            with open(pdf_path, 'rb') as attachment:
-                part.set_payload(attachment.read())
-            encoders.encode_base64(part)
-            part.add_header('Content-Disposition', f'attachment; filename= {os.path.basename(pdf_path)}')
-            message.attach(part)
+        raw_message = build_reply_message(
+            email_recipient, original_subject, body, os.path.basename(pdf_path), pdf_data
+        )
         
-        # Send
-        raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-        send_message = {'raw': raw_message}
+        # Send as a single multipart upload (raw MIME, no extra base64url copy)
+        media = MediaIoBaseUpload(
+            io.BytesIO(raw_message),
+            mimetype='message/rfc822',
+            resumable=False
+        )
         
-        service.users().messages().send(userId='me', body=send_message).execute()
+        with gmail_send_lock:
+            service.users().messages().send(userId='me', body={}, media_body=media).execute()
         log_message(f"✅ Reply sent to {email_recipient}")
         return True
         
@@ -115,21 +118,85 @@ def send_reply_email(service, email_recipient: str, original_subject: str,
 # MAIN PROCESSING FUNCTION
 # ============================================================================
 
+def create_lead_pdf(groq_client, message_id: str, name: str, website: str) -> Optional[str]:
+    """Build the personalized PDF for one lead. Returns the PDF filename or None."""
+    # Reuse a recent summary of this website if we have one
+    summary = load_cached_summary(website)
+    
+    if summary:
+        log_message(f"♻️ Using cached summary for {website}")
+    else:
+        # Scrape website
+        log_message(f"🌐 Scraping website: {website}")
+        website_content = scrape_website(website)
+        
+        if not website_content:
+            log_message(f"❌ Failed to scrape {website}. Cannot proceed.")
+            return None
+        
+        # Summarize with Groq
+        log_message(f"📄 Generating summary from website content...")
+        summary = summarize_with_groq(website_content, groq_client)
+        
+        if not summary:
+            log_message(f"❌ Failed to generate summary. Cannot proceed.")
+            return None
+        
+        save_cached_summary(website, summary)
+    
+    # Extract company info and generate blurbs (single Groq call)
+    log_message(f"🏢 Extracting company information and service recommendations...")
+    company_name, description, blurbs = extract_company_details(summary, groq_client)
+    log_message(f"   Company: {company_name}")
+    log_message(f"   Description: {description}")
+    
+    # Generate document
+    log_message(f"📝 Creating personalized document...")
+    docx_filename = generate_personalized_document(
+        name, company_name, description, blurbs, message_id
+    )
+    
+    if not docx_filename:
+        log_message(f"❌ Failed to generate document. Cannot proceed.")
+        return None
+    
+    # Convert to PDF
+    docx_path = os.path.join("personalised", docx_filename)
+    pdf_filename = convert_docx_to_pdf(docx_path, "personalised")
+    
+    if not pdf_filename:
+        log_message(f"❌ PDF conversion failed. Cannot proceed.")
+        return None
+    
+    return pdf_filename
+
 def process_incoming_email(service, groq_client, email_data: dict) -> bool:
     """Process a single incoming email through the entire pipeline."""
     
     try:
         message_id = email_data['message_id']
+        # Leads run in parallel; tag this worker's log lines with the lead
+        set_log_prefix(f"[{message_id}] ")
+        
         sender = email_data['sender']
         subject = email_data['subject']
         body = email_data['body']
         
+        if message_id in get_processed_message_ids():
+            log_message(f"ℹ️ Email {message_id} already processed. Skipping.")
+            return False
+        
+        if message_id in rejected_message_ids:
+            log_message(f"ℹ️ Email {message_id} already rejected. Skipping.")
+            return False
+        
         log_message(f"\n📬 Processing email from {sender}")
         
         # Validate email
         is_valid, name, email, website = validate_email(sender, subject, body)
         
         if not is_valid:
+            rejected_message_ids.add(message_id)
             log_message(f"⚠️ Email does not meet qualification criteria. Skipping.")
             return False
         
@@ -139,77 +206,59 @@ def process_incoming_email(service, groq_client, email_data: dict) -> bool:
         add_or_update_lead(message_id, name, email, website)
         log_message(f"📊 Added to leads database with Message ID: {message_id}")
         
-        # Scrape website
-        log_message(f"🌐 Scraping website: {website}")
-        website_content = scrape_website(website)
-        
-        if not website_content:
-            log_message(f"❌ Failed to scrape {website}. Cannot proceed.")
-            return False
-        
-        # Summarize with Groq
-        log_message(f"📄 Generating summary from website content...")
-        summary = summarize_with_groq(website_content, groq_client)
-        
-        if not summary:
-            log_message(f"❌ Failed to generate summary. Cannot proceed.")
-            return False
+        # A previous attempt (retried via retry_ids) may have built the PDF
+        # and then failed to send it
+        pdf_filename = get_lead_pdf(message_id)
         
-        # Extract company info
-        log_message(f"🏢 Extracting company information...")
-        company_name = extract_company_name(summary, groq_client)
-        log_message(f"   Company: {company_name}")
+        if pdf_filename and os.path.exists(os.path.join("personalised", pdf_filename)):
+            log_message(f"♻️ Reusing PDF from a previous attempt: {pdf_filename}")
+        else:
+            pdf_filename = create_lead_pdf(groq_client, message_id, name, website)
+            
+            if not pdf_filename:
+                return False
+            
+            set_lead_pdf(message_id, pdf_filename)
         
-        description = extract_company_description(summary, groq_client)
-        log_message(f"   Description: {description}")
+        pdf_path = os.path.join("personalised", pdf_filename)
         
-        # Generate blurbs
-        log_message(f"💭 Generating personalized service recommendations...")
-        blurbs = generate_blurbs(company_name, summary, groq_client)
+        # Read the PDF once; the reply and Telegram share the bytes
+        pdf_data = Path(pdf_path).read_bytes() if os.path.exists(pdf_path) else None
         
-        # Generate document
-        log_message(f"📝 Creating personalized document...")
-        docx_filename = generate_personalized_document(
-            name, company_name, description, blurbs, message_id
+        # Send reply email with PDF
+        log_message(f"📧 Sending reply email to {email}...")
+        email_body = create_email_body(name)
+        reply_sent = send_reply_email(
+            service, email, subject, email_body, pdf_path, message_id, pdf_data
         )
         
-        if not docx_filename:
-            log_message(f"❌ Failed to generate document. Cannot proceed.")
+        if not reply_sent:
+            log_message(f"❌ Failed to send reply email.")
             return False
         
-        # Convert to PDF
-        docx_path = os.path.join("personalised", docx_filename)
-        pdf_filename = convert_docx_to_pdf(docx_path, "personalised")
+        mark_as_done(message_id)
+        log_message(f"✅ Lead marked as completed")
         
-        if not pdf_filename:
-            log_message(f"❌ PDF conversion failed. Cannot proceed.")
-            return False
-        
-        pdf_path = os.path.join("personalised", pdf_filename)
-        
-        # Send Telegram notification with PDF
-        log_message(f"📲 Sending notification to Telegram...")
-        if os.path.exists(pdf_path):
-            if send_telegram_document(pdf_path):
+        # Notify only once the lead is done, so a retried reply never re-sends the PDF
+        if pdf_data is not None:
+            log_message(f"📲 Sending notification to Telegram...")
+            if send_telegram_document(pdf_path, pdf_data):
                 log_message(f"✅ PDF notification sent successfully!")
             else:
                 log_message(f"⚠️ Telegram notification failed (check API token/User ID)")
         
-        # Send reply email with PDF
-        log_message(f"📧 Sending reply email to {email}...")
-        email_body = create_email_body(name)
-        
-        if send_reply_email(service, email, subject, email_body, pdf_path, message_id):
-            mark_as_done(message_id)
-            log_message(f"✅ Lead marked as completed")
-            return True
-        else:
-            log_message(f"❌ Failed to send reply email.")
-            return False
+        return True
             
     except Exception as e:
         log_failure("process_incoming_email", f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}")
         return False
+    
+    finally:
+        set_log_prefix("")
+
+def lead_retry_delay(attempts: int) -> int:
+    """Seconds to wait before retrying a lead that has failed `attempts` times."""
+    return min(LEAD_RETRY_MAX_DELAY, LEAD_RETRY_BASE_DELAY * 2 ** (attempts - 1))
 
 # ============================================================================
 # GROQ API KEY MANAGEMENT
@@ -243,7 +292,7 @@ def main_loop(groq_api_key: str):
     log_message("✅ Gmail API authenticated.")
     
     # Create Groq client
-    groq_client = Groq(api_key=groq_api_key)
+    groq_client = create_groq_client(groq_api_key)
     
     # Test Groq connection
     if not test_groq_connection(groq_client):
@@ -254,27 +303,132 @@ def main_loop(groq_api_key: str):
     start_telegram_buffer_thread()
     log_message("📲 Telegram notification system started.")
     
+    # Resume from the last run, or pick up only emails arriving from now on
+    history_id = load_history_id()
+    if history_id:
+        log_message(f"📭 Resuming inbox sync from history ID {history_id}.")
+    else:
+        history_id = get_current_history_id(service)
+        save_history_id(history_id)
+        log_message(f"📭 Watching inbox for new emails (history ID {history_id}).")
+    
+    # Leads that failed (or could not be fetched) are retried on later checks
+    retry_ids = load_retry_message_ids()
+    if retry_ids:
+        log_message(f"🔁 {len(retry_ids)} unfinished lead(s) from the last run will be retried.")
+    
+    # Push notifications (optional): wake up as soon as Gmail reports new mail
+    new_mail_event = threading.Event()
+    push_future = None
+    watch_started_at = 0.0
+    listener_started_at = 0.0
+    wait_interval = EMAIL_FETCH_INTERVAL
+    
+    if push_configured() and start_gmail_watch(service):
+        watch_started_at = listener_started_at = time.monotonic()
+        push_future = start_push_listener(new_mail_event)
+        if push_future is not None:
+            wait_interval = PUSH_FALLBACK_INTERVAL
+    
     iteration = 0
     
-    while True:
-        iteration += 1
-        log_message(f"\n--- Iteration {iteration} @ {datetime.now().strftime('%H:%M:%S')} ---")
-        
-        try:
-            # Fetch latest email
-            email_data = fetch_latest_email(service)
+    try:
+        while True:
+            iteration += 1
+            log_message(f"\n--- Iteration {iteration} @ {time.strftime('%H:%M:%S')} ---")
+            new_mail_event.clear()  # Notifications from here on trigger the next check
+            
+            try:
+                # Fetch emails added since the last check, plus earlier failures now due
+                new_ids, latest_history_id = fetch_new_message_ids(service, history_id)
+                now = time.time()
+                due_ids = [
+                    message_id for message_id, (_, retry_at) in retry_ids.items()
+                    if retry_at <= now
+                ]
+                message_ids = list(dict.fromkeys([*due_ids, *new_ids]))
+                
+                # Don't download messages that were already handled
+                processed_ids = get_processed_message_ids()
+                message_ids = [
+                    message_id for message_id in message_ids
+                    if message_id not in processed_ids and message_id not in rejected_message_ids
+                ]
+                
+                if message_ids:
+                    log_message(f"📥 {len(message_ids)} email(s) to process ({len(new_ids)} new).")
+                    emails = fetch_emails(service, message_ids)
+                    
+                    # Process the batch in parallel; wait for all before advancing
+                    futures = [
+                        pipeline_executor.submit(process_incoming_email, service, groq_client, email_data)
+                        for email_data in emails
+                    ]
+                    for future in futures:
+                        future.result()
+                else:
+                    log_message("ℹ️ No new emails in inbox.")
+                
+                # Whatever is neither done nor rejected (failed, or not fetched) is
+                # retried later, waiting longer after each failed attempt
+                attempted = set(message_ids)
+                unfinished = {
+                    message_id: entry for message_id, entry in retry_ids.items()
+                    if message_id not in attempted
+                }
+                for message_id in message_ids:
+                    if message_id in processed_ids or message_id in rejected_message_ids:
+                        continue
+                    
+                    attempts = retry_ids.get(message_id, (0, 0.0))[0] + 1
+                    if attempts >= LEAD_RETRY_LIMIT:
+                        log_failure("process_incoming_email", f"Giving up on email {message_id} after {attempts} attempts")
+                        continue
+                    
+                    delay = lead_retry_delay(attempts)
+                    unfinished[message_id] = (attempts, now + delay)
+                    log_message(f"🔁 Email {message_id} will be retried in {delay} seconds (attempt {attempts + 1}/{LEAD_RETRY_LIMIT})")
+                
+                if unfinished != retry_ids:
+                    retry_ids = unfinished
+                    save_retry_message_ids(retry_ids)
+                
+                # Failed leads are tracked in retry_ids, so the history can move on
+                if latest_history_id != history_id:
+                    history_id = latest_history_id
+                    save_history_id(history_id)
             
-            if email_data:
-                process_incoming_email(service, groq_client, email_data)
+            except Exception as e:
+                log_failure("main_loop", f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}")
+            
+            # A stopped subscriber (it also wakes the loop) is restarted once per
+            # PUSH_FALLBACK_INTERVAL; if it keeps dying, poll at the normal rate
+            if push_future is not None and push_future.done():
+                log_message(f"⚠️ Gmail push listener stopped ({describe_listener_stop(push_future)}).")
+                push_future = None
+                
+                if time.monotonic() - listener_started_at >= PUSH_FALLBACK_INTERVAL:
+                    listener_started_at = time.monotonic()
+                    push_future = start_push_listener(new_mail_event)
+                
+                if push_future is None:
+                    wait_interval = EMAIL_FETCH_INTERVAL
+                    log_message(f"⚠️ Push notifications off; checking every {EMAIL_FETCH_INTERVAL} seconds.")
+            
+            # Gmail stops publishing when a watch expires (7 days); renew before then
+            if push_future is not None and time.monotonic() - watch_started_at >= GMAIL_WATCH_RENEW_INTERVAL:
+                if start_gmail_watch(service):
+                    watch_started_at = time.monotonic()
+            
+            # Wait before next check (a push notification ends the wait early)
+            if push_future is not None:
+                log_message(f"⏰ Waiting for new mail (checking anyway in {wait_interval} seconds)...")
             else:
-                log_message("ℹ️ No new emails in inbox.")
-        
-        except Exception as e:
-            log_failure("main_loop", f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}")
-        
-        # Wait before next check
-        log_message(f"⏰ Waiting {EMAIL_FETCH_INTERVAL} seconds before next check...")
-        time.sleep(EMAIL_FETCH_INTERVAL)
+                log_message(f"⏰ Waiting {wait_interval} seconds before next check...")
+            new_mail_event.wait(wait_interval)
+    finally:
+        if push_future is not None:
+            push_future.cancel()
 
 def main():
     """Initialize and start the main loop."""
@@ -0,0 +1,107 @@
+# ============================================================================
+# MODULE: AI CACHE
+# ============================================================================
+# Content-hash cache for Groq responses (in-memory + persistent on disk)
+# ============================================================================
+
+import json
+import time
+import atexit
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from config import GROQ_CACHE_FILE, GROQ_CACHE_TTL, GROQ_MEMORY_CACHE_SIZE
+from modules.logger import log_message
+
+_cache_lock = threading.Lock()
+_memory_cache = OrderedDict()
+_disk_cache = None
+
+def _open_disk_cache() -> sqlite3.Connection:
+    """Open the SQLite cache once, on first use, dropping expired entries."""
+    global _disk_cache
+
+    if _disk_cache is None:
+        # Access is serialized by _cache_lock, so one connection can be shared
+        connection = sqlite3.connect(GROQ_CACHE_FILE, check_same_thread=False, isolation_level=None)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS groq_cache ("
+                "hash TEXT PRIMARY KEY, response TEXT NOT NULL, ts INTEGER NOT NULL)"
+            )
+            connection.execute(
+                "DELETE FROM groq_cache WHERE ts < ?", (int(time.time()) - GROQ_CACHE_TTL,)
+            )
+        except sqlite3.Error:
+            connection.close()  # Set up again on the next call
+            raise
+
+        _disk_cache = connection
+        atexit.register(_disk_cache.close)
+
+    return _disk_cache
+
+def _load(key: str):
+    """Return the unexpired stored response for key, or None."""
+    row = _open_disk_cache().execute(
+        "SELECT response FROM groq_cache WHERE hash = ? AND ts >= ?",
+        (key, int(time.time()) - GROQ_CACHE_TTL)
+    ).fetchone()
+
+    return json.loads(row[0]) if row else None
+
+def _store(key: str, value):
+    """Insert or refresh the stored response for key."""
+    _open_disk_cache().execute(
+        "INSERT OR REPLACE INTO groq_cache (hash, response, ts) VALUES (?, ?, ?)",
+        (key, json.dumps(value), int(time.time()))
+    )
+
+def _remember(key: str, value):
+    """Store a value in the bounded in-process cache."""
+    _memory_cache[key] = value
+    _memory_cache.move_to_end(key)
+
+    while len(_memory_cache) > GROQ_MEMORY_CACHE_SIZE:
+        _memory_cache.popitem(last=False)
+
+def cache_key(*parts) -> str:
+    """Build a SHA256 cache key from the prompt and call parameters."""
+    raw = "\x00".join(str(part) for part in parts)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+def cached_call(key: str, fn):
+    """
+    Return the cached response for key, or call fn() and cache its result.
+    Empty results (failed calls) are never cached.
+    """
+    with _cache_lock:
+        if key in _memory_cache:
+            _memory_cache.move_to_end(key)
+            return _memory_cache[key]
+
+        try:
+            value = _load(key)
+        except sqlite3.Error as e:
+            # e.g. "database is locked": the disk cache is an optimization only
+            log_message(f"⚠️ Groq cache read failed ({e}); calling the API")
+            value = None
+
+        if value is not None:
+            _remember(key, value)
+            return value
+
+    value = fn()
+
+    if value:
+        with _cache_lock:
+            _remember(key, value)
+            try:
+                _store(key, value)
+            except sqlite3.Error as e:
+                log_message(f"⚠️ Groq cache write failed ({e})")
+
+    return value
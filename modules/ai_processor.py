@@ -5,27 +5,68 @@
 # ============================================================================
 
 import re
-from datetime import datetime
+import json
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 from groq import Groq
 from config import (
-    GROQ_MODEL, GROQ_MAX_TOKENS, GROQ_TEMPERATURE,
+    GROQ_MODEL, GROQ_MAX_TOKENS, GROQ_TEMPERATURE, SUMMARY_MAX_CHARS,
+    GROQ_HTTP_TIMEOUT, GROQ_MAX_CONNECTIONS, GROQ_MAX_CONCURRENT, GROQ_MAX_RETRIES,
+    GROQ_SHORT_MAX_TOKENS, GROQ_BLURBS_MAX_TOKENS, GROQ_EXTRACT_TEMPERATURE,
     SUMMARY_PROMPT, EXTRACT_COMPANY_PROMPT, EXTRACT_DESCRIPTION_PROMPT,
-    GENERATE_BLURBS_PROMPT, MASTER_LOG
+    GENERATE_BLURBS_PROMPT, COMBINED_EXTRACTION_PROMPT
 )
+from modules.logger import log_message
+from modules.ai_cache import cache_key, cached_call
+from modules.optional_deps import HTTP2_AVAILABLE
 
-def log_message(message: str, log_file: str = MASTER_LOG):
-    """Log to console and file with timestamp."""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"[{timestamp}] {message}\n"
-    print(message)
-    with open(log_file, 'a', encoding='utf-8') as logf:
-        logf.write(log_entry)
+try:
+    from orjson import loads as json_loads
+except ImportError:  # Optional dependency: orjson parses several times faster
+    json_loads = json.loads
+
+# Number of blurb placeholders in the document template
+BLURB_COUNT = 5
+
+# Precompiled patterns for cleaning model output
+_RE_BOLD = re.compile(r'\*\*(.*?)\*\*')
+_RE_WS = re.compile(r'\s+')
+_RE_BLURB = re.compile(r'^[ \t]*\d+[\.\)][ \t]*(.+)$', re.MULTILINE)
+_RE_JSON_OBJECT = re.compile(r'\{.*\}', re.DOTALL)
+_RE_PLACEHOLDER = re.compile(r'(?<!\{)\{\w+\}')
+
+# Caps concurrent Groq requests across all threads (leads, fallback prompts)
+_groq_slots = threading.BoundedSemaphore(GROQ_MAX_CONCURRENT)
+
+# Workers for independent Groq prompts on the same lead
+_groq_executor = ThreadPoolExecutor(max_workers=GROQ_MAX_CONCURRENT)
+
+def create_groq_client(api_key: str) -> Groq:
+    """Create a Groq client on a persistent, pooled (HTTP/2 if available) connection."""
+    http_client = httpx.Client(
+        http2=HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=GROQ_MAX_CONNECTIONS,
+            max_keepalive_connections=GROQ_MAX_CONNECTIONS
+        ),
+        timeout=GROQ_HTTP_TIMEOUT
+    )
+    # The SDK retries rate limits, 5xx and connection errors with jittered
+    # exponential backoff (honouring Retry-After)
+    return Groq(api_key=api_key, http_client=http_client, max_retries=GROQ_MAX_RETRIES)
+
+def create_completion(client, **kwargs):
+    """Run a chat completion, waiting for a free request slot first."""
+    with _groq_slots:
+        return client.chat.completions.create(model=GROQ_MODEL, **kwargs)
 
 def test_groq_connection(client):
     """Quick test to validate Groq API connection."""
     try:
-        response = client.chat.completions.create(
-            model=GROQ_MODEL,
+        response = create_completion(
+            client,
             messages=[{"role": "user", "content": "Say 'Connection successful!'"}],
             max_tokens=10,
             temperature=0.1
@@ -37,14 +78,48 @@ def test_groq_connection(client):
         log_message(f"❌ Groq connection test failed: {error_msg}")
         return False
 
-def call_groq(prompt: str, client) -> str:
-    """Helper to call Groq API."""
+@lru_cache(maxsize=None)
+def split_prompt(template: str) -> tuple:
+    """
+    Split a prompt template at the line holding its first {placeholder}.
+    Returns: (static instructions, variable template)
+    """
+    match = _RE_PLACEHOLDER.search(template)
+    if not match:
+        return "", template
+
+    start = template.rfind('\n', 0, match.start()) + 1
+    instructions = template[:start].strip().replace('{{', '{').replace('}}', '}')
+    return instructions, template[start:]
+
+def build_messages(template: str, **values) -> list:
+    """
+    Build chat messages from a prompt template: the static instructions go in
+    a system message (a byte-identical prefix the provider can cache), the
+    filled-in variable part in the user message.
+    """
+    instructions, variable_template = split_prompt(template)
+    messages = [{"role": "user", "content": variable_template.format(**values).strip()}]
+
+    if instructions:
+        messages.insert(0, {"role": "system", "content": instructions})
+
+    return messages
+
+def call_groq(messages: list, client, max_tokens: int = GROQ_MAX_TOKENS,
+              temperature: float = GROQ_TEMPERATURE) -> str:
+    """Helper to call Groq API (cached by message hash)."""
+    key = cache_key('chat', GROQ_MODEL, max_tokens, temperature, json.dumps(messages))
+    return cached_call(key, lambda: _request_groq(messages, client, max_tokens, temperature))
+
+def _request_groq(messages: list, client, max_tokens: int, temperature: float) -> str:
+    """Perform the actual Groq chat completion request."""
     try:
-        response = client.chat.completions.create(
-            model=GROQ_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=GROQ_MAX_TOKENS,
-            temperature=GROQ_TEMPERATURE
+        response = create_completion(
+            client,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature
         )
         return response.choices[0].message.content.strip()
     except Exception as e:
@@ -52,32 +127,104 @@ def call_groq(prompt: str, client) -> str:
         log_message(f"❌ Groq API error: {error_msg}")
         return ""
 
+def call_groq_json(messages: list, client) -> dict:
+    """Helper to call Groq API in JSON mode (cached). Returns parsed object or {}."""
+    key = cache_key('json', GROQ_MODEL, GROQ_MAX_TOKENS, GROQ_TEMPERATURE, json.dumps(messages))
+    return cached_call(key, lambda: _request_groq_json(messages, client))
+
+def _request_groq_json(messages: list, client) -> dict:
+    """Perform the actual Groq JSON-mode request and parse the response."""
+    try:
+        response = create_completion(
+            client,
+            messages=messages,
+            max_tokens=GROQ_MAX_TOKENS,
+            temperature=GROQ_TEMPERATURE,
+            response_format={"type": "json_object"}
+        )
+        return parse_json_object(response.choices[0].message.content)
+    except Exception as e:
+        error_msg = f"{type(e).__name__}: {str(e)}"
+        log_message(f"❌ Groq API error: {error_msg}")
+        return {}
+
+def parse_json_object(text: str) -> dict:
+    """Parse a JSON object from model output, tolerating prose or code fences around it."""
+    try:
+        data = json_loads(text)
+    except (TypeError, ValueError):
+        # Fall back to the outermost {...} block in the text
+        match = _RE_JSON_OBJECT.search(text or '')
+        if not match:
+            log_message("⚠️ Groq response contained no JSON object.")
+            return {}
+        try:
+            data = json_loads(match.group(0))
+        except ValueError:
+            log_message("⚠️ Groq response contained malformed JSON.")
+            return {}
+
+    return data if isinstance(data, dict) else {}
+
 def summarize_with_groq(content: str, client) -> str:
     """Generate summary using Groq API."""
     if not content.strip():
         log_message("⚠️ Content is empty – skipping summary.")
         return "No content available for summarization."
 
+    # Key on the normalized original content so truncation only happens on a cache miss
+    key = cache_key(
+        'summary', GROQ_MODEL, GROQ_TEMPERATURE, SUMMARY_PROMPT, SUMMARY_MAX_CHARS,
+        normalize_for_cache(content)
+    )
+    summary = cached_call(key, lambda: _request_summary(truncate_content(content), client))
+
+    if summary:
+        log_message(f"✅ Generated summary ({len(summary)} chars)")
+
+    return summary
+
+def normalize_for_cache(content: str) -> str:
+    """
+    Reduce content to what matters for its summary: case and whitespace runs
+    are ignored, so re-scrapes that only reflow the page share one cache entry.
+    Numbers are kept (summaries carry phone numbers, addresses and prices).
+    """
+    return _RE_WS.sub(' ', content.lower()).strip()
+
+def truncate_content(content: str) -> str:
+    """Trim content to SUMMARY_MAX_CHARS without cutting a word in half."""
     original_len = len(content)
 
-    if original_len > 4000:
-        content = content[:4000] + "\n\n[Content truncated for summarization...]"
-        log_message(f"📝 Content truncated to 4000 chars (original: {original_len} chars).")
+    if original_len <= SUMMARY_MAX_CHARS:
+        return content
+
+    truncated = content[:SUMMARY_MAX_CHARS]
+    boundary = max(truncated.rfind(' '), truncated.rfind('\n'))
+    if boundary > SUMMARY_MAX_CHARS // 2:
+        truncated = truncated[:boundary]
 
+    log_message(f"📝 Content truncated to {len(truncated)} chars (original: {original_len} chars).")
+    return truncated.rstrip() + "\n\n[Content truncated for summarization...]"
+
+def _request_summary(content: str, client) -> str:
+    """Perform the actual Groq summary request and clean the output."""
     try:
-        response = client.chat.completions.create(
-            model=GROQ_MODEL,
-            messages=[{"role": "user", "content": SUMMARY_PROMPT.format(content=content)}],
+        response = create_completion(
+            client,
+            messages=build_messages(SUMMARY_PROMPT, content=content),
             max_tokens=400,
             temperature=GROQ_TEMPERATURE
         )
 
         summary = response.choices[0].message.content.strip()
-        summary = re.sub(r'\n+', ' ', summary)
-        summary = re.sub(r'\*\*(.*?)\*\*', r'\1', summary)
-        summary = re.sub(r'\s+', ' ', summary).strip()
+        # Cheap membership checks skip the cleanup passes on clean output;
+        # one split/join collapses newlines and whitespace runs together
+        if '\n' in summary or '  ' in summary or '\t' in summary or '\r' in summary:
+            summary = ' '.join(summary.split())
+        if '**' in summary:
+            summary = _RE_BOLD.sub(r'\1', summary).strip()
 
-        log_message(f"✅ Generated summary ({len(summary)} chars)")
         return summary
 
     except Exception as e:
@@ -85,19 +232,15 @@ def summarize_with_groq(content: str, client) -> str:
         log_message(f"❌ Error generating summary: {error_msg}")
         return ""
 
-def extract_company_name(summary: str, client) -> str:
-    """Extract company name from summary."""
-    company_name = call_groq(EXTRACT_COMPANY_PROMPT.format(summary=summary), client)
-    
+def clean_company_name(company_name: str) -> str:
+    """Apply fallback for missing company names."""
     if not company_name or company_name.lower() in ['unknown', 'n/a', '']:
         company_name = "Professional Organization"
     
     return company_name
 
-def extract_company_description(summary: str, client) -> str:
-    """Extract company description from summary."""
-    description = call_groq(EXTRACT_DESCRIPTION_PROMPT.format(summary=summary), client)
-    
+def clean_company_description(description: str) -> str:
+    """Apply fallback and 'providing ...' phrasing to a description."""
     if not description or description.lower() in ['unknown', 'n/a', '']:
         description = "innovative solutions in the digital space."
     
@@ -107,35 +250,90 @@ def extract_company_description(summary: str, client) -> str:
     
     return description
 
+def pad_blurbs(blurbs: list) -> list:
+    """Ensure we have exactly BLURB_COUNT blurbs."""
+    blurbs = list(blurbs[:BLURB_COUNT])
+    
+    if len(blurbs) < BLURB_COUNT:
+        default = "Service offering tailored to your organization's needs."
+        blurbs.extend([default] * (BLURB_COUNT - len(blurbs)))
+    
+    return blurbs
+
+def extract_company_name(summary: str, client) -> str:
+    """Extract company name from summary."""
+    company_name = call_groq(
+        build_messages(EXTRACT_COMPANY_PROMPT, summary=summary), client,
+        max_tokens=GROQ_SHORT_MAX_TOKENS, temperature=GROQ_EXTRACT_TEMPERATURE
+    )
+    return clean_company_name(company_name)
+
+def extract_company_description(summary: str, client) -> str:
+    """Extract company description from summary."""
+    description = call_groq(
+        build_messages(EXTRACT_DESCRIPTION_PROMPT, summary=summary), client,
+        max_tokens=GROQ_SHORT_MAX_TOKENS, temperature=GROQ_EXTRACT_TEMPERATURE
+    )
+    return clean_company_description(description)
+
 def generate_blurbs(company_name: str, summary: str, client) -> list:
     """Generate personalized service blurbs."""
     log_message(f"💭 Generating personalized blurbs for {company_name}...")
     
     blurb_text = call_groq(
-        GENERATE_BLURBS_PROMPT.format(company_name=company_name, summary=summary),
-        client
+        build_messages(GENERATE_BLURBS_PROMPT, company_name=company_name, summary=summary),
+        client,
+        max_tokens=GROQ_BLURBS_MAX_TOKENS
     )
     
     blurbs = extract_blurbs_from_text(blurb_text)
     
     return blurbs
 
+def extract_company_details(summary: str, client) -> tuple:
+    """
+    Extract company name, description and blurbs with a single Groq call.
+    Falls back to the individual prompts if the JSON response is unusable.
+    Returns: (company_name, description, blurbs)
+    """
+    data = call_groq_json(build_messages(COMBINED_EXTRACTION_PROMPT, summary=summary), client)
+    
+    if not data:
+        log_message("⚠️ Combined extraction failed – falling back to individual prompts.")
+        # Name and description are independent; blurbs need the name
+        description_future = _groq_executor.submit(extract_company_description, summary, client)
+        company_name = extract_company_name(summary, client)
+        blurbs = generate_blurbs(company_name, summary, client)
+        description = description_future.result()
+        return company_name, description, blurbs
+    
+    company_name = clean_company_name(str(data.get('company') or '').strip())
+    description = clean_company_description(str(data.get('description') or '').strip())
+    
+    raw_blurbs = data.get('blurbs')
+    if not isinstance(raw_blurbs, list):
+        raw_blurbs = []
+    
+    blurbs = []
+    for blurb in raw_blurbs:
+        blurb = _RE_WS.sub(' ', str(blurb)).strip()
+        if blurb:
+            blurbs.append(blurb)
+            if len(blurbs) == BLURB_COUNT:
+                break
+    
+    return company_name, description, pad_blurbs(blurbs)
+
 def extract_blurbs_from_text(text: str) -> list:
     """Extract numbered blurbs from text."""
     blurbs = []
     
-    # Match numbered items like "1. Text here" or "1) Text here"
-    pattern = r'^\s*\d+[\.\)]\s*(.+)$'
-    
-    for line in text.split('\n'):
-        match = re.match(pattern, line)
-        if match:
-            blurb = match.group(1).strip()
-            if blurb:
-                blurbs.append(blurb)
-    
-    # Ensure we have exactly 5 blurbs
-    while len(blurbs) < 5:
-        blurbs.append("Service offering tailored to your organization's needs.")
+    # Match numbered lines like "1. Text here" or "1) Text here" in one pass
+    for match in _RE_BLURB.finditer(text):
+        blurb = match.group(1).strip()
+        if blurb:
+            blurbs.append(blurb)
+            if len(blurbs) == BLURB_COUNT:
+                break
     
-    return blurbs[:5]
\ No newline at end of file
+    return pad_blurbs(blurbs)
\ No newline at end of file
@@ -6,16 +6,25 @@
 
 import os
 import csv
-from datetime import datetime
-from config import OUTPUT_CSV, MASTER_LOG
+import atexit
+import threading
+from config import OUTPUT_CSV
+from modules.logger import log_message
 
-def log_message(message: str, log_file: str = MASTER_LOG):
-    """Log to console and file with timestamp."""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"[{timestamp}] {message}\n"
-    print(message)
-    with open(log_file, 'a', encoding='utf-8') as logf:
-        logf.write(log_entry)
+FIELDNAMES = ['Message_ID', 'Name', 'Email', 'Website', 'Summary', 'PDF', 'Done']
+
+# Persistent append handle for new rows (opened on first use)
+_csv_file = None
+_csv_writer = None
+
+# In-memory copy of the lead database, loaded once from OUTPUT_CSV
+_lead_rows = []          # All rows, in file order
+_lead_rows_by_id = {}    # Message_ID -> row (first occurrence)
+_processed_ids = set()   # Message_IDs marked as Done
+_leads_loaded = False
+
+# Lead pipelines run in parallel; one lock guards the index and the CSV file
+_csv_lock = threading.RLock()
 
 def migrate_csv_format():
     """Migrate old CSV format to new format if needed."""
@@ -59,64 +68,105 @@ def migrate_csv_format():
             }
             new_rows.append(new_row)
 
-        fieldnames = ['Message_ID', 'Name', 'Email', 'Website', 'Summary', 'PDF', 'Done']
         with open(OUTPUT_CSV, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
             writer.writeheader()
             writer.writerows(new_rows)
 
         log_message(f"✅ CSV migrated successfully. {len(new_rows)} rows converted.")
 
-def init_csv():
-    """Initialize CSV file with headers if it doesn't exist."""
-    migrate_csv_format()
+def load_leads():
+    """Load the CSV into the in-memory lead index."""
+    global _leads_loaded
 
-    if not os.path.exists(OUTPUT_CSV):
-        fieldnames = ['Message_ID', 'Name', 'Email', 'Website', 'Summary', 'PDF', 'Done']
-        with open(OUTPUT_CSV, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-        log_message(f"📊 Created new CSV: {OUTPUT_CSV}")
-
-def get_processed_message_ids() -> set:
-    """Get all message IDs that have been marked as Done."""
-    processed = set()
+    _lead_rows.clear()
+    _lead_rows_by_id.clear()
+    _processed_ids.clear()
 
     if os.path.exists(OUTPUT_CSV):
         try:
             with open(OUTPUT_CSV, 'r', encoding='utf-8') as f:
                 reader = csv.DictReader(f)
                 for row in reader:
-                    message_id = row.get('Message_ID', '').strip()
-                    done = row.get('Done', '').strip().lower()
+                    _lead_rows.append(row)
+                    _lead_rows_by_id.setdefault(row.get('Message_ID'), row)
+
+                    message_id = (row.get('Message_ID') or '').strip()
+                    done = (row.get('Done') or '').strip().lower()
                     if message_id and done == 'yes':
-                        processed.add(message_id)
+                        _processed_ids.add(message_id)
         except Exception as e:
-            log_message(f"❌ Error reading processed message IDs: {e}")
+            log_message(f"❌ Error reading CSV: {e}")
 
-    return processed
+    _leads_loaded = True
 
-def add_or_update_lead(message_id: str, name: str, email: str, website: str):
-    """Add a new lead or update existing one in CSV."""
-    fieldnames = ['Message_ID', 'Name', 'Email', 'Website', 'Summary', 'PDF', 'Done']
-    rows = []
+def ensure_leads_loaded():
+    """Load the lead index on first use if init_csv() was not called."""
+    if not _leads_loaded:
+        with _csv_lock:
+            if not _leads_loaded:
+                load_leads()
 
-    if os.path.exists(OUTPUT_CSV):
-        try:
-            with open(OUTPUT_CSV, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                rows = list(reader)
-        except Exception as e:
-            log_message(f"❌ Error reading CSV: {e}")
-            rows = []
+def open_csv_writer():
+    """Return the shared append-mode DictWriter, opening the CSV once."""
+    global _csv_file, _csv_writer
+
+    if _csv_writer is None:
+        _csv_file = open(OUTPUT_CSV, 'a', newline='', encoding='utf-8')
+        _csv_writer = csv.DictWriter(_csv_file, fieldnames=FIELDNAMES)
+
+    return _csv_writer
+
+def close_csv_writer():
+    """Close the shared append handle (reopened on next use)."""
+    global _csv_file, _csv_writer
+
+    if _csv_file is not None:
+        _csv_file.close()
+    _csv_file = None
+    _csv_writer = None
+
+atexit.register(close_csv_writer)
+
+def write_all_leads():
+    """Rewrite the CSV from the in-memory lead index."""
+    close_csv_writer()
 
-    found = False
-    for row in rows:
-        if row.get('Message_ID') == message_id:
-            found = True
-            break
+    try:
+        with open(OUTPUT_CSV, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDNAMES)
+            writer.writeheader()
+            writer.writerows(_lead_rows)
+    except Exception as e:
+        log_message(f"❌ Error writing to CSV: {e}")
+
+def init_csv():
+    """Initialize CSV file with headers if it doesn't exist, then load it."""
+    migrate_csv_format()
+
+    is_new = not os.path.exists(OUTPUT_CSV)
+
+    load_leads()
+    writer = open_csv_writer()
+
+    if is_new:
+        writer.writeheader()
+        _csv_file.flush()
+        log_message(f"📊 Created new CSV: {OUTPUT_CSV}")
+
+def get_processed_message_ids() -> set:
+    """Get all message IDs that have been marked as Done (live set, do not mutate)."""
+    ensure_leads_loaded()
+    return _processed_ids
+
+def add_or_update_lead(message_id: str, name: str, email: str, website: str):
+    """Add a new lead to CSV (appended) unless it is already recorded."""
+    ensure_leads_loaded()
+
+    with _csv_lock:
+        if message_id in _lead_rows_by_id:
+            return
 
-    if not found:
         new_row = {
             'Message_ID': message_id,
             'Name': name,
@@ -126,38 +176,46 @@ def add_or_update_lead(message_id: str, name: str, email: str, website: str):
             'PDF': '',
             'Done': ''
         }
-        rows.append(new_row)
+        _lead_rows.append(new_row)
+        _lead_rows_by_id[message_id] = new_row
 
-    try:
-        with open(OUTPUT_CSV, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(rows)
-    except Exception as e:
-        log_message(f"❌ Error writing to CSV: {e}")
+        try:
+            open_csv_writer().writerow(new_row)
+            _csv_file.flush()
+        except Exception as e:
+            log_message(f"❌ Error writing to CSV: {e}")
+
+def get_lead_pdf(message_id: str) -> str:
+    """Return the PDF filename recorded for a lead ('' if none)."""
+    ensure_leads_loaded()
+
+    row = _lead_rows_by_id.get(message_id)
+    return (row.get('PDF') or '') if row else ''
+
+def set_lead_pdf(message_id: str, pdf_filename: str):
+    """
+    Remember the generated PDF for a lead so a retry can resend it without
+    rebuilding. Kept in memory; written to the CSV by mark_as_done's rewrite.
+    """
+    ensure_leads_loaded()
+
+    with _csv_lock:
+        row = _lead_rows_by_id.get(message_id)
+
+        if row is not None:
+            row['PDF'] = pdf_filename
 
 def mark_as_done(message_id: str):
     """Mark a message as Done in CSV."""
-    fieldnames = ['Message_ID', 'Name', 'Email', 'Website', 'Summary', 'PDF', 'Done']
-    rows = []
+    ensure_leads_loaded()
 
-    try:
-        with open(OUTPUT_CSV, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            rows = list(reader)
-    except Exception as e:
-        log_message(f"❌ Error reading CSV: {e}")
-        return
+    with _csv_lock:
+        row = _lead_rows_by_id.get(message_id)
 
-    for row in rows:
-        if row.get('Message_ID') == message_id:
-            row['Done'] = 'Yes'
-            break
+        if row is None:
+            log_message(f"⚠️ Message ID {message_id} not found in CSV")
+            return
 
-    try:
-        with open(OUTPUT_CSV, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(rows)
-    except Exception as e:
-        log_message(f"❌ Error writing to CSV: {e}")
\ No newline at end of file
+        row['Done'] = 'Yes'
+        _processed_ids.add(message_id)
+        write_all_leads()
@@ -7,52 +7,86 @@
 import os
 import re
 import subprocess
-from datetime import datetime
-from docx import Document
-from config import TEMPLATE_FILE, PERSONALISED_DIR, MASTER_LOG
-
-def log_message(message: str, log_file: str = MASTER_LOG):
-    """Log to console and file with timestamp."""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"[{timestamp}] {message}\n"
-    print(message)
-    with open(log_file, 'a', encoding='utf-8') as logf:
-        logf.write(log_entry)
+import zipfile
+import threading
+from xml.sax.saxutils import escape
+from config import TEMPLATE_FILE, PERSONALISED_DIR, PDF_CONVERT_TIMEOUT
+from modules.logger import log_message
+from modules.retry import retry_call
+
+# Template placeholders (each must sit in a single run of word/document.xml)
+DOCUMENT_XML_PART = 'word/document.xml'
+NAME_PLACEHOLDER = "(Name)"
+COMPANY_PLACEHOLDER = "(company name)"
+DESCRIPTION_PLACEHOLDER = "(what your company deals with)"
+BLURB_PLACEHOLDER = "Input Blerbs here"
+
+_RE_PLACEHOLDERS = re.compile("|".join(re.escape(placeholder) for placeholder in (
+    NAME_PLACEHOLDER, COMPANY_PLACEHOLDER, DESCRIPTION_PLACEHOLDER, BLURB_PLACEHOLDER
+)))
+
+_RE_UNSAFE_FILENAME = re.compile(r'[\\/\*?:"<>|]')
+_RE_COMPANY_FILENAME = re.compile(r'[^\w\s-]')
+
+# Parsed template, reused until the file changes (path -> (mtime_ns, members, document_xml))
+_template_cache = {}
+_template_lock = threading.Lock()
+
+# Serializes LibreOffice runs (one soffice instance per user profile)
+_libreoffice_lock = threading.Lock()
 
 def sanitize_filename(name):
     """Make filenames safe for all OS."""
-    return re.sub(r'[\\/\*?:"<>|]', "_", name)
-
-def replace_single_placeholder(doc, placeholder, replacement):
-    """Replace a single placeholder in document paragraphs and runs."""
-    for paragraph in doc.paragraphs:
-        if placeholder in paragraph.text:
-            for run in paragraph.runs:
-                if placeholder in run.text:
-                    run.text = run.text.replace(placeholder, replacement)
-
-def replace_blurbs(doc, blurbs):
-    """Replace blurb placeholders in document."""
-    blurb_mappings = [
-        ("Input Blerbs here", blurbs[0] if len(blurbs) > 0 else "Service offering"),
-        ("Input Blerbs here", blurbs[1] if len(blurbs) > 1 else "Service offering"),
-        ("Input Blerbs here", blurbs[2] if len(blurbs) > 2 else "Service offering"),
-        ("Input Blerbs here", blurbs[3] if len(blurbs) > 3 else "Service offering"),
-        ("Input Blerbs here", blurbs[4] if len(blurbs) > 4 else "Service offering"),
-    ]
+    return _RE_UNSAFE_FILENAME.sub("_", name)
+
+def fill_document_xml(document_xml: str, values: dict, blurbs: list) -> str:
+    """
+    Replace every placeholder in the template's document.xml in one regex pass.
+    values maps single placeholders to text; blurb placeholders are filled in order.
+    """
+    remaining_blurbs = iter(blurbs)
+
+    def replace(match):
+        placeholder = match.group(0)
+        if placeholder == BLURB_PLACEHOLDER:
+            return escape(next(remaining_blurbs, placeholder))
+        return escape(values[placeholder])
+
+    return _RE_PLACEHOLDERS.sub(replace, document_xml)
+
+def load_template(template_path: str) -> tuple:
+    """
+    Return the template's zip members and document.xml text, read from disk
+    only on first use or after the template file has changed.
+    Returns: (members, document_xml) where members is [(ZipInfo, bytes), ...]
+    """
+    mtime = os.stat(template_path).st_mtime_ns
+
+    with _template_lock:
+        cached = _template_cache.get(template_path)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+
+    with zipfile.ZipFile(template_path) as template:
+        members = [(item, template.read(item.filename)) for item in template.infolist()]
+
+    document_xml = next(
+        data for item, data in members if item.filename == DOCUMENT_XML_PART
+    ).decode('utf-8')
+
+    with _template_lock:
+        _template_cache[template_path] = (mtime, members, document_xml)
 
-    # Replace in paragraphs
-    found_count = 0
-    for paragraph in doc.paragraphs:
-        if found_count >= len(blurbs):
-            break
-        if "Input Blerbs here" in paragraph.text:
-            for run in paragraph.runs:
-                if "Input Blerbs here" in run.text:
-                    run.text = run.text.replace("Input Blerbs here", blurbs[found_count])
-                    found_count += 1
-                    if found_count >= len(blurbs):
-                        break
+    return members, document_xml
+
+def write_docx(members: list, docx_path: str, document_xml: str):
+    """Write a copy of the template members with document.xml replaced."""
+    with zipfile.ZipFile(docx_path, 'w', zipfile.ZIP_DEFLATED) as output:
+        for item, data in members:
+            if item.filename == DOCUMENT_XML_PART:
+                output.writestr(item, document_xml)
+            else:
+                output.writestr(item, data)
 
 def generate_personalized_document(
     name: str,
@@ -74,20 +108,22 @@ def generate_personalized_document(
         return None
 
     try:
-        doc = Document(TEMPLATE_FILE)
+        members, document_xml = load_template(TEMPLATE_FILE)
 
         # Replace placeholders
-        replace_single_placeholder(doc, "(Name)", name)
-        replace_single_placeholder(doc, "(company name)", company_name)
-        replace_single_placeholder(doc, "(what your company deals with)", description)
-        replace_blurbs(doc, blurbs)
+        document_xml = fill_document_xml(document_xml, {
+            NAME_PLACEHOLDER: name,
+            COMPANY_PLACEHOLDER: company_name,
+            DESCRIPTION_PLACEHOLDER: description
+        }, blurbs)
 
         # Generate filename
-        safe_company = re.sub(r'[^\w\s-]', '', company_name).strip().replace(' ', '_')
-        docx_filename = f"{safe_company}_{message_id[:8]}.docx"
+        safe_company = _RE_COMPANY_FILENAME.sub('', company_name).strip().replace(' ', '_')
+        # Full message ID: IDs of mail arriving close together share a prefix
+        docx_filename = f"{safe_company}_{message_id}.docx"
         docx_path = os.path.join(PERSONALISED_DIR, docx_filename)
 
-        doc.save(docx_path)
+        write_docx(members, docx_path, document_xml)
         log_message(f"✅ DOCX created: {docx_filename}")
 
         return docx_filename
@@ -105,27 +141,26 @@ def convert_docx_to_pdf(docx_path: str, output_dir: str) -> str:
         log_message(f"❌ DOCX file not found: {docx_path}")
         return None
 
+    pdf_filename = os.path.basename(docx_path).replace('.docx', '.pdf')
+    pdf_path = os.path.join(output_dir, pdf_filename)
+
     try:
         log_message(f"🔄 Converting DOCX to PDF...")
 
-        # Try using LibreOffice
-        command = [
-            "libreoffice",
-            "--headless",
-            "--convert-to", "pdf",
-            "--outdir", output_dir,
-            docx_path
-        ]
-
-        result = subprocess.run(command, capture_output=True, timeout=30)
+        # A PDF left by an earlier attempt must not pass for this run's output
+        if os.path.exists(pdf_path):
+            os.remove(pdf_path)
 
-        if result.returncode != 0:
-            log_message(f"⚠️ LibreOffice conversion warning (code {result.returncode})")
+        try:
+            retry_call(
+                run_libreoffice, docx_path, output_dir, pdf_path,
+                retry_on=(RuntimeError,),
+                description="LibreOffice conversion"
+            )
+        except RuntimeError as e:
+            log_message(f"⚠️ LibreOffice conversion warning ({e})")
 
         # Check if PDF was created
-        pdf_filename = os.path.basename(docx_path).replace('.docx', '.pdf')
-        pdf_path = os.path.join(output_dir, pdf_filename)
-
         if os.path.exists(pdf_path):
             log_message(f"✅ PDF created: {pdf_filename}")
             return pdf_filename
@@ -141,9 +176,35 @@ def convert_docx_to_pdf(docx_path: str, output_dir: str) -> str:
         return None
     
     except subprocess.TimeoutExpired:
-        log_message("❌ PDF conversion timed out (30 seconds)")
+        log_message(f"❌ PDF conversion timed out ({PDF_CONVERT_TIMEOUT} seconds)")
         return None
     
     except Exception as e:
         log_message(f"❌ Error converting to PDF: {type(e).__name__}: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+def run_libreoffice(docx_path: str, output_dir: str, pdf_path: str):
+    """
+    Run one headless LibreOffice conversion. Raises RuntimeError only when it
+    exited non-zero without writing pdf_path (worth retrying).
+    """
+    command = [
+        "libreoffice",
+        "--headless",
+        "--convert-to", "pdf",
+        "--outdir", output_dir,
+        docx_path
+    ]
+
+    # LibreOffice refuses to run twice on the same user profile
+    with _libreoffice_lock:
+        result = subprocess.run(command, capture_output=True, timeout=PDF_CONVERT_TIMEOUT)
+
+    if result.returncode != 0:
+        stderr = result.stderr.decode('utf-8', errors='replace').strip()
+        error = f"code {result.returncode}" + (f": {stderr}" if stderr else "")
+
+        # A failed exit can follow a written PDF; only retry if it is missing
+        if not os.path.exists(pdf_path):
+            raise RuntimeError(error)
+        log_message(f"⚠️ LibreOffice conversion warning ({error})")
@@ -4,49 +4,96 @@
 # Handles Gmail API interactions and email validation
 # ============================================================================
 
+import os
 import re
 import base64
 import pickle
 from typing import Dict, List, Optional
-from datetime import datetime
-from urllib.parse import urlparse
+from email.utils import parseaddr
 from bs4 import BeautifulSoup
+from google.oauth2.credentials import Credentials
 from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
 from config import (
-    TOKEN_FILE, SYSTEM_EMAIL_DOMAINS, SYSTEM_EMAIL_KEYWORDS, 
-    KEYWORDS, MASTER_LOG
+    TOKEN_FILE, LEGACY_TOKEN_FILE, HISTORY_ID_FILE, RETRY_IDS_FILE, GMAIL_BATCH_SIZE,
+    SYSTEM_EMAIL_DOMAINS_SET, SYSTEM_EMAIL_MAILBOXES, SYSTEM_EMAIL_KEYWORDS, KEYWORDS,
+    FREE_EMAIL_PROVIDERS
 )
-
-def log_message(message: str, log_file: str = MASTER_LOG):
-    """Log to console and file with timestamp."""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"[{timestamp}] {message}\n"
-    print(message)
-    with open(log_file, 'a', encoding='utf-8') as logf:
-        logf.write(log_entry)
+from modules.logger import log_message
+from modules.keyword_matcher import build_keyword_matcher
+from modules.optional_deps import HTML_PARSER
+
+# Partial response: only the parts of a message extract_message_data reads
+MESSAGE_FIELDS = 'id,payload(mimeType,headers,body/data,parts)'
+
+_RE_BLANK_LINES = re.compile(r'\n\s*\n+')
+# Hostnames, bare or inside URLs (the scheme and path fall outside the match)
+_RE_HOST = re.compile(r'\b(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}\b')
+# "Name <address>" with bounded runs so hostile headers cannot backtrack
+_RE_SENDER = re.compile(r'^([^<]{1,128}?)\s*<([^>]{1,320})>\s*$')
+
+# Matchers built once at import (inputs must be lowercased)
+find_system_keyword = build_keyword_matcher(SYSTEM_EMAIL_KEYWORDS)
+find_brochure_keyword = build_keyword_matcher(KEYWORDS)
+MIN_SYSTEM_KEYWORD_LENGTH = min(len(k) for k in SYSTEM_EMAIL_KEYWORDS)
+
+def save_credentials(creds):
+    """Write Gmail OAuth credentials to TOKEN_FILE as JSON."""
+    with open(TOKEN_FILE, 'w', encoding='utf-8') as token:
+        token.write(creds.to_json())
+
+def load_saved_credentials() -> Optional[Credentials]:
+    """Load Gmail credentials from TOKEN_FILE, converting an old token.pickle once."""
+    if os.path.exists(TOKEN_FILE):
+        return Credentials.from_authorized_user_file(TOKEN_FILE)
+
+    if os.path.exists(LEGACY_TOKEN_FILE):
+        with open(LEGACY_TOKEN_FILE, 'rb') as token:
+            creds = pickle.load(token)
+        save_credentials(creds)
+        log_message(f"🔄 Converted {LEGACY_TOKEN_FILE} to {TOKEN_FILE}")
+        return creds
+
+    return None
+
+def build_gmail_service(creds):
+    """Build the Gmail client from the discovery document bundled with the library."""
+    return build('gmail', 'v1', credentials=creds, static_discovery=True, cache_discovery=False)
 
 def authenticate_gmail():
-    """Authenticate with Gmail API using token.pickle from gmail_auth.py."""
-    import os
+    """Authenticate with Gmail API using the token saved by gmail_auth.py."""
+    creds = load_saved_credentials()
     
-    if not os.path.exists(TOKEN_FILE):
+    if creds is None:
         raise FileNotFoundError(f"❌ {TOKEN_FILE} not found! Run gmail_auth.py first to authenticate.")
     
-    with open(TOKEN_FILE, 'rb') as token:
-        creds = pickle.load(token)
-    
-    return build('gmail', 'v1', credentials=creds)
+    return build_gmail_service(creds)
 
 def clean_html_to_text(html_content):
     """Convert HTML email content into plain readable text."""
-    soup = BeautifulSoup(html_content, 'html.parser')
+    soup = BeautifulSoup(html_content, HTML_PARSER)
     text = soup.get_text(separator='\n')
-    text = re.sub(r'\n\s*\n+', '\n\n', text.strip())
-    return text
+    return _RE_BLANK_LINES.sub('\n\n', text.strip())
+
+def decode_body_data(data: str) -> str:
+    """Decode base64url-encoded Gmail body data."""
+    return base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
+
+def iter_message_parts(payload):
+    """Yield the leaf MIME parts of a Gmail payload, including nested multiparts."""
+    parts = payload.get('parts')
+
+    if not parts:
+        yield payload
+        return
+
+    for part in parts:
+        yield from iter_message_parts(part)
 
 def extract_message_data(message):
     """Extract sender, subject, and body text from a Gmail API message."""
-    headers = message['payload'].get('headers', [])
+    payload = message['payload']
+    headers = payload.get('headers', [])
     sender = subject = None
 
     for header in headers:
@@ -57,109 +104,246 @@ def extract_message_data(message):
             subject = header['value']
 
     body = ""
-    parts = message['payload'].get('parts', [])
 
-    if parts:
-        for part in parts:
+    if payload.get('parts'):
+        # Prefer text/plain; only decode and parse HTML if there is none
+        plain_parts = []
+        html_data = None
+
+        for part in iter_message_parts(payload):
+            data = part.get('body', {}).get('data')
+            if not data:
+                continue
             mime_type = part.get('mimeType', '')
-            data = part['body'].get('data')
-            if data:
-                decoded_data = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-                if mime_type == 'text/plain':
-                    body += decoded_data
-                elif mime_type == 'text/html' and not body:
-                    body += clean_html_to_text(decoded_data)
+            if mime_type == 'text/plain':
+                plain_parts.append(decode_body_data(data))
+            elif mime_type == 'text/html' and html_data is None:
+                html_data = data
+
+        if plain_parts:
+            body = ''.join(plain_parts)
+        elif html_data:
+            body = clean_html_to_text(decode_body_data(html_data))
     else:
-        data = message['payload']['body'].get('data')
+        data = payload['body'].get('data')
         if data:
-            decoded_data = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
-            if message['payload']['mimeType'] == 'text/html':
+            decoded_data = decode_body_data(data)
+            if payload['mimeType'] == 'text/html':
                 body = clean_html_to_text(decoded_data)
             else:
                 body = decoded_data
 
     return sender, subject, body.strip()
 
-def fetch_latest_email(service) -> Optional[Dict]:
-    """Fetch the latest email from Gmail inbox."""
+def build_email_data(message_id: str, message) -> Dict:
+    """Build the email_data dict used by the pipeline from a Gmail message."""
+    sender, subject, body = extract_message_data(message)
+
+    return {
+        'message_id': message_id,
+        'sender': sender,
+        'subject': subject,
+        'body': body
+    }
+
+def fetch_email(service, message_id: str) -> Optional[Dict]:
+    """Fetch a single email by its Gmail message ID."""
     try:
-        results = service.users().messages().list(
-            userId='me',
-            labelIds=['INBOX'],
-            maxResults=1,
-            q=''
+        msg = service.users().messages().get(
+            userId='me', id=message_id, fields=MESSAGE_FIELDS
         ).execute()
+        return build_email_data(message_id, msg)
 
-        messages = results.get('messages', [])
+    except Exception as e:
+        log_message(f"❌ Error fetching email: {type(e).__name__}: {str(e)}")
+        return None
 
-        if not messages:
-            return None
+def fetch_emails(service, message_ids: List[str]) -> List[Dict]:
+    """
+    Fetch several emails using batched HTTP requests (one round-trip per
+    GMAIL_BATCH_SIZE messages). Returns email_data dicts in the order of message_ids.
+    """
+    if len(message_ids) == 1:
+        email_data = fetch_email(service, message_ids[0])
+        return [email_data] if email_data else []
+
+    results = {}
+
+    def on_message(request_id, response, exception):
+        if exception is not None:
+            log_message(f"❌ Error fetching email {request_id}: {type(exception).__name__}: {str(exception)}")
+            return
+        try:
+            results[request_id] = build_email_data(request_id, response)
+        except Exception as e:
+            log_message(f"❌ Error parsing email {request_id}: {type(e).__name__}: {str(e)}")
+
+    for start in range(0, len(message_ids), GMAIL_BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=on_message)
+        for message_id in message_ids[start:start + GMAIL_BATCH_SIZE]:
+            batch.add(
+                service.users().messages().get(
+                    userId='me', id=message_id, fields=MESSAGE_FIELDS
+                ),
+                request_id=message_id
+            )
+        try:
+            batch.execute()
+        except Exception as e:
+            log_message(f"❌ Error fetching emails: {type(e).__name__}: {str(e)}")
+
+    return [results[message_id] for message_id in message_ids if message_id in results]
+
+def get_current_history_id(service) -> str:
+    """Return the mailbox's current history ID (starting point for sync)."""
+    profile = service.users().getProfile(userId='me').execute()
+    return profile['historyId']
+
+def load_history_id() -> Optional[str]:
+    """Return the history ID saved by the previous run, if any."""
+    if not os.path.exists(HISTORY_ID_FILE):
+        return None
 
-        message_id = messages[0]['id']
-        msg = service.users().messages().get(userId='me', id=message_id).execute()
+    try:
+        with open(HISTORY_ID_FILE, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError as e:
+        log_message(f"⚠️ Could not read {HISTORY_ID_FILE}: {e}")
+        return None
 
-        sender, subject, body = extract_message_data(msg)
+def save_history_id(history_id: str):
+    """Persist the history ID so the next run resumes from it."""
+    try:
+        with open(HISTORY_ID_FILE, 'w', encoding='utf-8') as f:
+            f.write(str(history_id))
+    except OSError as e:
+        log_message(f"⚠️ Could not write {HISTORY_ID_FILE}: {e}")
 
-        return {
-            'message_id': message_id,
-            'sender': sender,
-            'subject': subject,
-            'body': body
-        }
+def load_retry_message_ids() -> Dict[str, tuple]:
+    """
+    Return the leads left to retry by the previous run
+    (message ID -> (failed attempts, time.time() when the next retry is due)).
+    """
+    retry_ids = {}
 
-    except Exception as e:
-        log_message(f"❌ Error fetching email: {type(e).__name__}: {str(e)}")
-        return None
+    if not os.path.exists(RETRY_IDS_FILE):
+        return retry_ids
 
-def is_system_email(sender: str, subject: str, body: str) -> bool:
+    try:
+        with open(RETRY_IDS_FILE, 'r', encoding='utf-8') as f:
+            for line in f:
+                fields = line.split()
+                if fields:
+                    # Older files have no due time (or attempt count): retry right away
+                    message_id, attempts, retry_at = (fields + ['0', '0'])[:3]
+                    retry_ids[message_id] = (int(attempts), float(retry_at))
+    except (OSError, ValueError) as e:
+        log_message(f"⚠️ Could not read {RETRY_IDS_FILE}: {e}")
+
+    return retry_ids
+
+def save_retry_message_ids(retry_ids: Dict[str, tuple]):
+    """Persist the leads to retry so they survive a restart."""
+    try:
+        with open(RETRY_IDS_FILE, 'w', encoding='utf-8') as f:
+            f.writelines(
+                f"{message_id} {attempts} {retry_at:.0f}\n"
+                for message_id, (attempts, retry_at) in retry_ids.items()
+            )
+    except OSError as e:
+        log_message(f"⚠️ Could not write {RETRY_IDS_FILE}: {e}")
+
+def fetch_new_message_ids(service, start_history_id: str) -> tuple:
     """
-    Detect if email is from a system/automated source.
-    Returns True if email should be IGNORED (is a system email).
+    List messages added to the inbox since start_history_id.
+    Returns: (message_ids, latest_history_id)
     """
-    if not sender:
-        return True
+    message_ids = {}
+    latest_history_id = start_history_id
+    page_token = None
+
+    while True:
+        try:
+            response = service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded'],
+                labelId='INBOX',
+                pageToken=page_token
+            ).execute()
+        except HttpError as e:
+            # History IDs expire after about a week; restart from the current one
+            if e.resp.status != 404:
+                raise
+            log_message(f"⚠️ History ID {start_history_id} expired. Resyncing from now.")
+            return [], get_current_history_id(service)
+
+        for record in response.get('history', []):
+            for added in record.get('messagesAdded', []):
+                message_ids[added['message']['id']] = True
+
+        latest_history_id = response.get('historyId', latest_history_id)
+        page_token = response.get('nextPageToken')
+
+        if not page_token:
+            break
+
+    return list(message_ids), latest_history_id
+
+def is_system_sender(sender: str) -> Optional[str]:
+    """
+    Check a sender against SYSTEM_EMAIL_DOMAINS.
+    Returns the matching entry (e.g. 'google.com' or 'noreply@'), or None.
+    """
+    address = parseaddr(sender)[1].lower()
+    mailbox, _, domain = address.rpartition('@')
 
-    sender_lower = sender.lower()
-    subject_lower = subject.lower() if subject else ""
-    body_lower = body.lower() if body else ""
-    full_content = f"{subject_lower} {body_lower}"
+    # Exact domain or any parent domain (mail.google.com -> google.com)
+    labels = domain.split('.')
+    for i in range(len(labels) - 1):
+        candidate = '.'.join(labels[i:])
+        if candidate in SYSTEM_EMAIL_DOMAINS_SET:
+            return candidate
 
-    # Check against system email domains
-    for domain in SYSTEM_EMAIL_DOMAINS:
-        if domain.lower() in sender_lower:
-            log_message(f"🚫 Detected system email domain: {domain}")
-            return True
+    if mailbox.endswith(SYSTEM_EMAIL_MAILBOXES):
+        for system_mailbox in SYSTEM_EMAIL_MAILBOXES:
+            if mailbox.endswith(system_mailbox):
+                return f"{system_mailbox}@"
 
-    # Check against system email keywords
-    for keyword in SYSTEM_EMAIL_KEYWORDS:
-        if keyword.lower() in full_content:
-            log_message(f"🚫 Detected system email keyword: '{keyword}'")
-            return True
+    return None
 
-    return False
+def is_system_email_sender(sender: str) -> bool:
+    """Return True if the sender is missing or is a known system address."""
+    if not sender:
+        return True
 
-def extract_websites(text):
-    """Find URLs or bare domains in the email body."""
-    urls = re.findall(r'(https?://[^\s]+)', text)
-    bare_domains = re.findall(r'\b(?:[a-zA-Z0-9-]+\.)+[a-zA-Z]{2,}\b', text)
+    domain = is_system_sender(sender.lower())
+    if domain:
+        log_message(f"🚫 Detected system email domain: {domain}")
+        return True
 
-    all_domains = set()
+    return False
 
-    for url in urls:
-        parsed = urlparse(url)
-        domain = parsed.netloc or parsed.path
-        if domain:
-            all_domains.add(domain.lower())
+def has_system_keyword(subject_lower: str, body_lower: str) -> bool:
+    """Return True if the (already lowercased) subject or body contains a system keyword."""
+    # Nothing to scan if neither can hold even the shortest keyword
+    if max(len(subject_lower), len(body_lower)) < MIN_SYSTEM_KEYWORD_LENGTH:
+        return False
+
+    keyword = find_system_keyword(subject_lower) or find_system_keyword(body_lower)
+    if keyword:
+        log_message(f"🚫 Detected system email keyword: '{keyword}'")
+        return True
 
-    for d in bare_domains:
-        if '.' in d:
-            all_domains.add(d.lower())
+    return False
 
-    return list(all_domains)
+def extract_websites(text):
+    """Find hostnames (from URLs or bare domains) in the email body, in order of appearance."""
+    return list(dict.fromkeys(host.lower() for host in _RE_HOST.findall(text)))
 
-def contains_keywords(text):
-    """Detect brochure/catalogue-related words."""
-    return any(word in text.lower() for word in KEYWORDS)
+def contains_keywords(text_lower):
+    """Detect brochure/catalogue-related words (text must already be lowercased)."""
+    return find_brochure_keyword(text_lower) is not None
 
 def validate_email(sender: str, subject: str, body: str) -> tuple:
     """
@@ -167,30 +351,36 @@ def validate_email(sender: str, subject: str, body: str) -> tuple:
     Returns: (is_valid, name, email, website)
     """
     # First: Check if it's a system email (reject if it is)
-    if is_system_email(sender, subject, body):
+    if is_system_email_sender(sender):
+        return False, "", "", ""
+
+    # Lowercase once; shared by the keyword checks and website extraction
+    subject_lower = (subject or "").lower()
+    body_lower = (body or "").lower()
+
+    if has_system_keyword(subject_lower, body_lower):
         return False, "", "", ""
 
     # Extract name and email
-    sender_match = re.search(r'([\w\s]+) <([^>]+)>', sender)
+    sender_match = _RE_SENDER.match(sender.strip())
 
     if sender_match:
-        name = sender_match.group(1).strip()
+        name = sender_match.group(1).strip().strip('"\'').strip()
         email = sender_match.group(2).strip()
     else:
         name = ""
         email = ""
 
     # Check keywords
-    full_text = f"{subject} {body}"
-    has_keywords = contains_keywords(full_text)
+    has_keywords = contains_keywords(subject_lower) or contains_keywords(body_lower)
 
     # Extract websites
-    websites = extract_websites(body)
+    websites = extract_websites(body_lower)
 
     # Fallback: use email domain if no website found
     if not websites and email:
         email_domain = email.split('@')[-1]
-        if not re.search(r'gmail|yahoo|outlook|hotmail', email_domain):
+        if FREE_EMAIL_PROVIDERS.isdisjoint(email_domain.lower().split('.')):
             websites = [email_domain]
 
     # Validate
@@ -0,0 +1,68 @@
+# ============================================================================
+# MODULE: GMAIL WATCHER
+# ============================================================================
+# Optional Gmail push notifications through Cloud Pub/Sub
+# ============================================================================
+
+import threading
+from config import GMAIL_PUBSUB_TOPIC, GMAIL_PUBSUB_SUBSCRIPTION
+from modules.logger import log_message
+
+try:
+    from google.cloud import pubsub_v1
+except ImportError:  # Optional dependency
+    pubsub_v1 = None
+
+def push_configured() -> bool:
+    """Return True if Pub/Sub push is configured and google-cloud-pubsub is installed."""
+    if not GMAIL_PUBSUB_TOPIC or not GMAIL_PUBSUB_SUBSCRIPTION:
+        return False
+
+    if pubsub_v1 is None:
+        log_message("⚠️ GMAIL_PUBSUB_TOPIC is set but google-cloud-pubsub is not installed. Polling instead.")
+        return False
+
+    return True
+
+def start_gmail_watch(service) -> bool:
+    """Ask Gmail to publish INBOX changes to GMAIL_PUBSUB_TOPIC (call again to renew)."""
+    try:
+        response = service.users().watch(
+            userId='me',
+            body={'topicName': GMAIL_PUBSUB_TOPIC, 'labelIds': ['INBOX']}
+        ).execute()
+        log_message(f"🔔 Gmail push watch active (history ID {response.get('historyId')}).")
+        return True
+
+    except Exception as e:
+        log_message(f"❌ Error starting Gmail watch: {type(e).__name__}: {str(e)}")
+        return False
+
+def describe_listener_stop(future) -> str:
+    """Why a finished streaming pull future stopped."""
+    if future.cancelled():
+        return "cancelled"
+
+    error = future.exception()
+    return f"{type(error).__name__}: {error}" if error else "closed"
+
+def start_push_listener(new_mail_event: threading.Event):
+    """
+    Subscribe to GMAIL_PUBSUB_SUBSCRIPTION and set new_mail_event on every
+    notification (and once more if the subscriber stops, so the caller can
+    check the future). Returns the streaming pull future, or None on failure.
+    """
+    def on_notification(message):
+        message.ack()
+        new_mail_event.set()
+
+    try:
+        subscriber = pubsub_v1.SubscriberClient()
+        future = subscriber.subscribe(GMAIL_PUBSUB_SUBSCRIPTION, callback=on_notification)
+        future.add_done_callback(lambda _: new_mail_event.set())
+        log_message(f"📡 Listening for Gmail push notifications on {GMAIL_PUBSUB_SUBSCRIPTION}")
+        return future
+
+    except Exception as e:
+        log_message(f"❌ Error subscribing to Pub/Sub: {type(e).__name__}: {str(e)}")
+        return None
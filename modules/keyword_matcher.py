@@ -0,0 +1,23 @@
+# ============================================================================
+# MODULE: KEYWORD MATCHER
+# ============================================================================
+# Multi-keyword substring search
+# ============================================================================
+
+def build_keyword_matcher(keywords):
+    """
+    Build a matcher for a list of keywords.
+    Returns a function that takes an already-lowercased text and returns the
+    first keyword found in it, or None.
+    """
+    # Lowercased and de-duplicated once; at these list sizes repeated C-level
+    # substring scans (str.__contains__) beat an Aho-Corasick automaton
+    needles = tuple(dict.fromkeys(k.lower() for k in keywords if k))
+
+    def find_keyword(text):
+        for needle in needles:
+            if needle in text:
+                return needle
+        return None
+
+    return find_keyword
@@ -0,0 +1,196 @@
+# ============================================================================
+# MODULE: LOGGER
+# ============================================================================
+# Shared console + file logging built on the standard logging module
+# ============================================================================
+
+import os
+import sys
+import queue
+import atexit
+import logging
+import threading
+import time
+from typing import Optional
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from config import (
+    MASTER_LOG, LOG_FLUSH_EVERY, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_LEVEL
+)
+
+LOG_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# One configured logger per log file (path -> logging.Logger)
+_loggers = {}
+_listeners = []
+_loggers_lock = threading.Lock()
+
+# Per-thread tag put in front of log lines (pipeline workers tag their lead)
+_log_context = threading.local()
+
+# Last formatted second (timestamps only change once per second)
+_last_timestamp = (None, "")
+
+def format_timestamp(created: Optional[float] = None) -> str:
+    """Format a time.time() value as LOG_DATE_FORMAT, reusing the string within the same second."""
+    global _last_timestamp
+
+    second = int(time.time() if created is None else created)
+    cached_second, cached_text = _last_timestamp
+    if second == cached_second:
+        return cached_text
+
+    text = time.strftime(LOG_DATE_FORMAT, time.localtime(second))
+    _last_timestamp = (second, text)
+    return text
+
+class CachedTimeFormatter(logging.Formatter):
+    """Formatter whose asctime comes from format_timestamp()."""
+
+    def formatTime(self, record, datefmt=None):
+        return format_timestamp(record.created)
+
+class BatchFileHandler(RotatingFileHandler):
+    """Rotating file handler that collects records and writes them in one call per flush."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pending = []
+        self._last_record = None  # Reported by handleError if a batch cannot be written
+
+    def _open(self):
+        # Unbuffered binary append: batches are encoded once and handed to os.write
+        return open(self.baseFilename, 'ab', buffering=0)
+
+    def emit(self, record):
+        try:
+            self._pending.append(self.format(record) + self.terminator)
+            self._last_record = record
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            if not self._pending:
+                return
+
+            data = ''.join(self._pending).encode(self.encoding or 'utf-8')
+            self._pending.clear()
+
+            # Like RotatingFileHandler.emit: a failed write (disk full, log locked
+            # during rollover) is reported and the batch dropped, never raised
+            # into the listener thread
+            try:
+                if self.stream is None:
+                    self.stream = self._open()
+
+                position = self.stream.tell()
+                if self.maxBytes > 0 and position and position + len(data) >= self.maxBytes:
+                    self.doRollover()
+                    if self.stream is None:
+                        self.stream = self._open()
+
+                fd = self.stream.fileno()
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+            except Exception:
+                self.handleError(self._last_record)
+        finally:
+            self.release()
+
+    def close(self):
+        self.flush()
+        super().close()
+
+class BatchQueueListener(QueueListener):
+    """Queue listener that flushes its handlers once the queue drains (or every LOG_FLUSH_EVERY records)."""
+
+    def __init__(self, log_queue, *handlers):
+        super().__init__(log_queue, *handlers, respect_handler_level=True)
+        self._unflushed = 0
+
+    def flush_handlers(self):
+        for handler in self.handlers:
+            handler.flush()
+        self._unflushed = 0
+
+    def handle(self, record):
+        super().handle(record)
+        self._unflushed += 1
+
+        if self._unflushed >= LOG_FLUSH_EVERY or self.queue.empty():
+            self.flush_handlers()
+
+def get_logger(log_file: str = MASTER_LOG) -> logging.Logger:
+    """Return the logger writing to console and log_file, configuring it once."""
+    with _loggers_lock:
+        logger = _loggers.get(log_file)
+        if logger is not None:
+            return logger
+
+        if log_file == MASTER_LOG:
+            name = "pipeline"
+        else:
+            name = f"pipeline.{os.path.splitext(os.path.basename(log_file))[0]}"
+
+        logger = logging.getLogger(name)
+        logger.setLevel(LOG_LEVEL)
+        logger.propagate = False
+
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter("%(message)s"))
+
+        file_handler = BatchFileHandler(
+            log_file,
+            maxBytes=LOG_MAX_BYTES,
+            backupCount=LOG_BACKUP_COUNT,
+            encoding='utf-8'
+        )
+        file_handler.setFormatter(
+            CachedTimeFormatter("[%(asctime)s] %(message)s")
+        )
+
+        # File writes happen on the listener thread, batched per drained queue
+        log_queue = queue.SimpleQueue()
+        listener = BatchQueueListener(log_queue, file_handler)
+        listener.start()
+
+        logger.addHandler(console_handler)
+        logger.addHandler(QueueHandler(log_queue))
+
+        _listeners.append(listener)
+        _loggers[log_file] = logger
+
+    return logger
+
+def stop_logging():
+    """Drain the log queues and stop the writer threads."""
+    with _loggers_lock:
+        listeners = list(_listeners)
+        _listeners.clear()
+        _loggers.clear()
+
+    for listener in listeners:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+atexit.register(stop_logging)
+
+def set_log_prefix(prefix: str = ""):
+    """Tag every line this thread logs with prefix (pass "" to clear)."""
+    _log_context.prefix = prefix
+
+def add_log_prefix(message: str) -> str:
+    """Insert this thread's log prefix, keeping leading blank lines in front of it."""
+    prefix = getattr(_log_context, 'prefix', '')
+    if not prefix:
+        return message
+
+    text = message.lstrip('\n')
+    return message[:len(message) - len(text)] + prefix + text
+
+def log_message(message: str, log_file: str = MASTER_LOG, level: int = logging.INFO):
+    """Log to console and file with timestamp."""
+    get_logger(log_file).log(level, add_log_prefix(message))
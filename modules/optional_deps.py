@@ -0,0 +1,17 @@
+# ============================================================================
+# MODULE: OPTIONAL DEPENDENCIES
+# ============================================================================
+# One place to detect optional accelerators shared by several modules
+# ============================================================================
+
+import importlib.util
+
+def is_installed(module_name: str) -> bool:
+    """Return True if module_name can be imported (without importing it)."""
+    return importlib.util.find_spec(module_name) is not None
+
+# BeautifulSoup parser: the C-backed lxml when it is installed
+HTML_PARSER = 'lxml' if is_installed('lxml') else 'html.parser'
+
+# httpx only negotiates HTTP/2 when the h2 package is installed
+HTTP2_AVAILABLE = is_installed('h2')
@@ -0,0 +1,36 @@
+# ============================================================================
+# MODULE: REPLY MESSAGE
+# ============================================================================
+# Builds the raw MIME reply that main.py uploads through the Gmail API
+# ============================================================================
+
+from typing import Optional
+from email import policy
+from email.message import EmailMessage
+
+# The raw message is uploaded inside a multipart/related body that
+# googleapiclient flattens as ASCII, so 8bit parts (short non-ASCII lines)
+# must be avoided: with cte_type='7bit' they go out quoted-printable/base64
+REPLY_POLICY = policy.SMTP.clone(cte_type='7bit')
+
+def build_reply_message(email_recipient: str, original_subject: str, body: str,
+                        pdf_filename: Optional[str] = None,
+                        pdf_data: Optional[bytes] = None) -> bytes:
+    """Return the reply (with the PDF attached, if given) as ASCII-only RFC 822 bytes."""
+    message = EmailMessage(policy=REPLY_POLICY)
+    message['To'] = email_recipient
+    message['Subject'] = f"Re: {original_subject}"
+
+    # Add body
+    message.set_content(body)
+
+    # Add attachment
+    if pdf_data is not None:
+        message.add_attachment(
+            pdf_data,
+            maintype='application',
+            subtype='pdf',
+            filename=pdf_filename
+        )
+
+    return message.as_bytes()
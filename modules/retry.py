@@ -0,0 +1,41 @@
+# ============================================================================
+# MODULE: RETRY
+# ============================================================================
+# Retries transient failures with capped exponential backoff and jitter
+# ============================================================================
+
+import time
+import random
+from config import RETRY_ATTEMPTS, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+from modules.logger import log_message
+
+def backoff_delay(attempt: int) -> float:
+    """Random delay before retry number `attempt` (full jitter, capped at RETRY_MAX_DELAY)."""
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1)))
+
+def describe_error(e: BaseException) -> str:
+    """
+    Exception type plus the HTTP status, if any. str(e) is left out on purpose:
+    request errors quote the full URL, which for Telegram contains the bot token.
+    """
+    status = getattr(getattr(e, 'response', None), 'status_code', None)
+    return f"{type(e).__name__} {status}" if status else type(e).__name__
+
+def retry_call(fn, *args, retry_on: tuple = (Exception,), description: str = "Call", **kwargs):
+    """
+    Call fn(*args, **kwargs), retrying up to RETRY_ATTEMPTS times in total
+    when it raises one of retry_on. The last exception is re-raised.
+    """
+    for attempt in range(1, RETRY_ATTEMPTS + 1):
+        try:
+            return fn(*args, **kwargs)
+        except retry_on as e:
+            if attempt == RETRY_ATTEMPTS:
+                raise
+
+            delay = backoff_delay(attempt)
+            log_message(
+                f"🔁 {description} failed ({describe_error(e)}); "
+                f"retrying in {delay:.1f}s (attempt {attempt + 1}/{RETRY_ATTEMPTS})"
+            )
+            time.sleep(delay)
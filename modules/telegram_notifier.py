@@ -7,26 +7,48 @@
 import os
 import requests
 import threading
-import time
-from datetime import datetime
-from config import TELEGRAM_BOT_TOKEN, TELEGRAM_USER_ID, TELEGRAM_BUFFER_INTERVAL, TELEGRAM_MAX_MESSAGE_LENGTH, MASTER_LOG
-
-def log_message(message: str, log_file: str = MASTER_LOG):
-    """Log to console and file with timestamp."""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"[{timestamp}] {message}\n"
-    print(message)
-    with open(log_file, 'a', encoding='utf-8') as logf:
-        logf.write(log_entry)
-
-# Global message buffer
+from typing import Optional
+from requests.adapters import HTTPAdapter
+from config import TELEGRAM_BOT_TOKEN, TELEGRAM_USER_ID, TELEGRAM_BUFFER_INTERVAL, TELEGRAM_MAX_MESSAGE_LENGTH
+from modules.retry import retry_call
+
+TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
+
+# Keep-alive session shared by all Telegram calls (one TLS handshake, reused)
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+# Flush early once this many characters are waiting (most of one message)
+TELEGRAM_FLUSH_THRESHOLD = int(TELEGRAM_MAX_MESSAGE_LENGTH * 0.8)
+
+# Global message buffer (the condition wakes the flusher when it fills up)
 telegram_message_buffer = []
-telegram_buffer_lock = threading.Lock()
+telegram_buffer_chars = 0
+telegram_buffer_condition = threading.Condition()
+
+# Keeps flushes from different threads from interleaving their chunks
+telegram_send_lock = threading.Lock()
 
 def add_to_telegram_buffer(message: str):
     """Add a message to the Telegram buffer."""
-    with telegram_buffer_lock:
+    global telegram_buffer_chars
+
+    with telegram_buffer_condition:
         telegram_message_buffer.append(message)
+        telegram_buffer_chars += len(message) + 1
+
+        if telegram_buffer_chars >= TELEGRAM_FLUSH_THRESHOLD:
+            telegram_buffer_condition.notify()
+
+def redact_token(text: str) -> str:
+    """Hide the bot token (request errors quote the full API URL)."""
+    return text.replace(TELEGRAM_BOT_TOKEN, "<token>") if TELEGRAM_BOT_TOKEN else text
+
+def check_retryable(response: requests.Response) -> requests.Response:
+    """Raise for responses worth retrying (rate limited or server error)."""
+    if response.status_code == 429 or response.status_code >= 500:
+        response.raise_for_status()
+    return response
 
 def send_telegram_message(text: str) -> bool:
     """Send a single message to Telegram."""
@@ -37,59 +59,78 @@ def send_telegram_message(text: str) -> bool:
         return False
 
     try:
-        telegram_api_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
         data = {
             "chat_id": TELEGRAM_USER_ID,
             "text": text,
             "parse_mode": "HTML"
         }
 
-        response = requests.post(f"{telegram_api_url}/sendMessage", json=data, timeout=10)
+        response = retry_call(
+            lambda: check_retryable(
+                _session.post(f"{TELEGRAM_API_URL}/sendMessage", json=data, timeout=10)
+            ),
+            retry_on=(requests.RequestException,),
+            description="Telegram message"
+        )
         return response.status_code == 200
 
     except Exception as e:
-        print(f"⚠️ Telegram send failed: {e}")
+        print(f"⚠️ Telegram send failed: {redact_token(str(e))}")
         return False
 
-def send_telegram_document(file_path: str) -> bool:
-    """Send a PDF document to Telegram."""
+def send_telegram_document(file_path: str, file_data: Optional[bytes] = None) -> bool:
+    """Send a PDF document to Telegram (file_data skips re-reading file_path)."""
     if not TELEGRAM_BOT_TOKEN or TELEGRAM_BOT_TOKEN == "YOUR_BOT_TOKEN_HERE":
         return False
 
     if not TELEGRAM_USER_ID or TELEGRAM_USER_ID == "YOUR_USER_ID_HERE":
         return False
 
-    if not os.path.exists(file_path):
+    if file_data is None and not os.path.exists(file_path):
         return False
 
     try:
-        telegram_api_url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}"
-        
-        with open(file_path, 'rb') as f:
-            files = {'document': f}
-            data = {'chat_id': TELEGRAM_USER_ID}
-            response = requests.post(
-                f"{telegram_api_url}/sendDocument",
-                data=data,
-                files=files,
-                timeout=30
-            )
-            return response.status_code == 200
+        if file_data is None:
+            with open(file_path, 'rb') as f:
+                file_data = f.read()
+
+        response = retry_call(
+            post_telegram_document, os.path.basename(file_path), file_data,
+            retry_on=(requests.RequestException,),
+            description="Telegram document upload"
+        )
+        return response.status_code == 200
 
     except Exception as e:
-        print(f"⚠️ Telegram PDF send failed: {e}")
+        print(f"⚠️ Telegram PDF send failed: {redact_token(str(e))}")
         return False
 
+def post_telegram_document(file_name: str, file_data: bytes) -> requests.Response:
+    """Post file_data as a Telegram document."""
+    response = _session.post(
+        f"{TELEGRAM_API_URL}/sendDocument",
+        data={'chat_id': TELEGRAM_USER_ID},
+        files={'document': (file_name, file_data)},
+        timeout=30
+    )
+    return check_retryable(response)
+
 def flush_telegram_buffer():
     """Flush buffered messages to Telegram."""
-    global telegram_message_buffer
+    global telegram_message_buffer, telegram_buffer_chars
+
+    with telegram_send_lock:
+        # Take the pending messages; producers are never blocked by network I/O
+        with telegram_buffer_condition:
+            if not telegram_message_buffer:
+                return
 
-    with telegram_buffer_lock:
-        if not telegram_message_buffer:
-            return
+            messages = telegram_message_buffer
+            telegram_message_buffer = []
+            telegram_buffer_chars = 0
 
         # Combine all messages
-        combined_message = "\n".join(telegram_message_buffer)
+        combined_message = "\n".join(messages)
 
         # Split into chunks if too long
         if len(combined_message) > TELEGRAM_MAX_MESSAGE_LENGTH:
@@ -102,14 +143,14 @@ def flush_telegram_buffer():
         else:
             send_telegram_message(combined_message)
 
-        telegram_message_buffer = []
-
 def start_telegram_buffer_thread():
-    """Start background thread to flush Telegram buffer every 15 seconds."""
+    """Start background thread to flush Telegram buffer every TELEGRAM_BUFFER_INTERVAL seconds (sooner when it fills up)."""
     def buffer_flusher():
         while True:
-            time.sleep(TELEGRAM_BUFFER_INTERVAL)
+            with telegram_buffer_condition:
+                if telegram_buffer_chars < TELEGRAM_FLUSH_THRESHOLD:
+                    telegram_buffer_condition.wait(TELEGRAM_BUFFER_INTERVAL)
             flush_telegram_buffer()
 
     thread = threading.Thread(target=buffer_flusher, daemon=True)
-    thread.start()
\ No newline at end of file
+    thread.start()
@@ -6,18 +6,32 @@
 
 import os
 import re
-import requests
+import time
+import hashlib
+import httpx
 from bs4 import BeautifulSoup
-from datetime import datetime
-from config import SCRAPED_DIR, MASTER_LOG
+from config import SCRAPED_DIR, SCRAPE_CACHE_TTL
+from modules.logger import log_message
+from modules.optional_deps import HTML_PARSER, HTTP2_AVAILABLE
 
-def log_message(message: str, log_file: str = MASTER_LOG):
-    """Log to console and file with timestamp."""
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"[{timestamp}] {message}\n"
-    print(message)
-    with open(log_file, 'a', encoding='utf-8') as logf:
-        logf.write(log_entry)
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+except ImportError:  # Optional dependency: fall back to BeautifulSoup
+    HTMLParser = None
+
+NON_CONTENT_TAGS = ["script", "style", "noscript"]
+
+_RE_BLANK_LINES = re.compile(r"\n\s*\n+")
+
+# One pooled client shared by every scrape (thread-safe; keeps connections
+# alive and reuses TLS sessions, HTTP/2 if available)
+_http_client = httpx.Client(
+    http2=HTTP2_AVAILABLE,
+    headers={"User-Agent": "Mozilla/5.0 (compatible; ScraperBot/1.0)"},
+    limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+    follow_redirects=True,
+    timeout=10
+)
 
 def sanitize_filename(name):
     """Make filenames safe for all OS."""
@@ -25,10 +39,8 @@ def sanitize_filename(name):
 
 def fetch_website_content(url):
     """Fetch website content politely."""
-    headers = {"User-Agent": "Mozilla/5.0 (compatible; ScraperBot/1.0)"}
-    
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = _http_client.get(url)
         
         if response.status_code == 200:
             return response.text
@@ -41,21 +53,68 @@ def fetch_website_content(url):
         return None
 
 def clean_html_to_text_scrape(html):
-    """Extract main readable text using BeautifulSoup."""
-    soup = BeautifulSoup(html, "html.parser")
-    
-    for tag in soup(["script", "style", "noscript"]):
-        tag.decompose()
-    
-    text = soup.get_text(separator="\n")
-    text = re.sub(r"\n\s*\n+", "\n\n", text.strip())
+    """Extract main readable text (selectolax if installed, else BeautifulSoup)."""
+    if HTMLParser is not None:
+        tree = HTMLParser(html)
+        tree.strip_tags(NON_CONTENT_TAGS)
+        text = tree.root.text(separator="\n") if tree.root else ""
+    else:
+        soup = BeautifulSoup(html, HTML_PARSER)
+        
+        for tag in soup(NON_CONTENT_TAGS):
+            tag.decompose()
+        
+        text = soup.get_text(separator="\n")
     
-    return text
+    return _RE_BLANK_LINES.sub("\n\n", text.strip())
 
-def scrape_website(website: str):
-    """Scrape and clean a website, return text content."""
+def normalize_url(website: str) -> str:
+    """Add a scheme if missing so the same site always maps to one URL."""
     if not website.startswith("http"):
         website = f"https://{website}"
+    return website
+
+def get_cache_path(website: str, suffix: str) -> str:
+    """Return the cache file path for a website (content-addressed by URL hash)."""
+    key = hashlib.sha256(normalize_url(website).lower().rstrip('/').encode('utf-8')).hexdigest()
+    return os.path.join(SCRAPED_DIR, f"{key}{suffix}")
+
+def read_cache(path: str):
+    """Return cached text if present and younger than SCRAPE_CACHE_TTL, else None."""
+    try:
+        if time.time() - os.path.getmtime(path) > SCRAPE_CACHE_TTL:
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def write_cache(path: str, text: str):
+    """Store text in the cache (failures are logged, not raised)."""
+    try:
+        os.makedirs(SCRAPED_DIR, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    except OSError as e:
+        log_message(f"⚠️ Could not write cache file {path}: {e}")
+
+def load_cached_summary(website: str):
+    """Return a cached Groq summary for this website, or None."""
+    return read_cache(get_cache_path(website, ".summary.txt"))
+
+def save_cached_summary(website: str, summary: str):
+    """Cache the Groq summary for this website."""
+    write_cache(get_cache_path(website, ".summary.txt"), summary)
+
+def scrape_website(website: str):
+    """Scrape and clean a website, return text content (cached in SCRAPED_DIR)."""
+    website = normalize_url(website)
+    cache_path = get_cache_path(website, ".txt")
+    
+    text = read_cache(cache_path)
+    if text:
+        log_message(f"♻️ Using cached content for {website}")
+        return text
     
     log_message(f"🌐 Scraping: {website}")
     
@@ -67,4 +126,7 @@ def scrape_website(website: str):
     
     text = clean_html_to_text_scrape(html)
     
+    if text:
+        write_cache(cache_path, text)
+    
     return text
\ No newline at end of file
@@ -0,0 +1,66 @@
+# ============================================================================
+# TESTS: REPLY MESSAGE
+# ============================================================================
+# Run with: python -m unittest
+# ============================================================================
+
+import io
+import unittest
+from email import message_from_bytes, policy
+from email.generator import BytesGenerator
+from email.mime.multipart import MIMEMultipart
+from email.mime.nonmultipart import MIMENonMultipart
+
+from modules.reply_message import build_reply_message
+
+PDF_DATA = b"%PDF-1.4\n\xe2\xe3\xcf\xd3\n%%EOF\n"
+
+def flatten_multipart_upload(raw_message: bytes) -> bytes:
+    """
+    Build the multipart/related body the way googleapiclient does for a
+    non-resumable media upload with a metadata body (discovery.py).
+    """
+    root = MIMEMultipart("related")
+    setattr(root, "_write_headers", lambda self: None)
+
+    metadata = MIMENonMultipart("application", "json")
+    metadata.set_payload("{}")
+    root.attach(metadata)
+
+    media = MIMENonMultipart("message", "rfc822")
+    media["Content-Transfer-Encoding"] = "binary"
+    media.set_payload(raw_message)
+    root.attach(media)
+
+    fp = io.BytesIO()
+    BytesGenerator(fp, mangle_from_=False).flatten(root, unixfrom=False)
+    return fp.getvalue()
+
+class BuildReplyMessageTest(unittest.TestCase):
+    def test_non_ascii_short_line_body(self):
+        # Short non-ASCII lines are what the default policy sends as 8bit
+        body = "Olá José, obrigado!\n"
+        raw_message = build_reply_message(
+            "jose@example.com", "Catálogo", body, "lead.pdf", PDF_DATA
+        )
+
+        self.assertTrue(raw_message.isascii())
+        self.assertIn(raw_message, flatten_multipart_upload(raw_message))
+
+        parsed = message_from_bytes(raw_message, policy=policy.default)
+        self.assertEqual(parsed["Subject"], "Re: Catálogo")
+        self.assertEqual(parsed.get_body().get_content().replace("\r\n", "\n"), body)
+
+        attachment = next(parsed.iter_attachments())
+        self.assertEqual(attachment.get_filename(), "lead.pdf")
+        self.assertEqual(attachment.get_content(), PDF_DATA)
+
+    def test_without_attachment(self):
+        raw_message = build_reply_message("a@example.com", "Hi", "Hello\n")
+
+        parsed = message_from_bytes(raw_message, policy=policy.default)
+        self.assertFalse(parsed.is_multipart())
+        self.assertEqual(parsed["To"], "a@example.com")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+# ============================================================================
+# TESTS: RETRY LOGGING
+# ============================================================================
+# Run with: python -m unittest
+# ============================================================================
+
+import io
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import requests
+
+from config import RETRY_ATTEMPTS
+from modules import retry, telegram_notifier
+
+BOT_TOKEN = "123456789:AAF-secret-bot-token"
+API_URL = f"https://api.telegram.org/bot{BOT_TOKEN}"
+
+def http_error(status_code: int) -> requests.HTTPError:
+    """An HTTPError as raise_for_status() builds it (the message quotes the URL)."""
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = f"{API_URL}/sendDocument"
+    try:
+        response.raise_for_status()
+    except requests.HTTPError as e:
+        return e
+
+class TelegramTokenNotLoggedTest(unittest.TestCase):
+    def run_with_failing_post(self, send, error):
+        """Call send() while every Telegram post raises error; return the log and stdout text."""
+        logged = []
+        stdout = io.StringIO()
+
+        with mock.patch.object(telegram_notifier, "TELEGRAM_BOT_TOKEN", BOT_TOKEN), \
+                mock.patch.object(telegram_notifier, "TELEGRAM_API_URL", API_URL), \
+                mock.patch.object(telegram_notifier, "TELEGRAM_USER_ID", "42"), \
+                mock.patch.object(telegram_notifier._session, "post", side_effect=error), \
+                mock.patch.object(retry, "log_message", logged.append), \
+                mock.patch.object(retry.time, "sleep"), \
+                redirect_stdout(stdout):
+            self.assertFalse(send())
+
+        self.assertEqual(len(logged), RETRY_ATTEMPTS - 1)
+        return "\n".join(logged), stdout.getvalue()
+
+    def test_connection_error(self):
+        error = requests.ConnectionError(
+            f"HTTPSConnectionPool(host='api.telegram.org', port=443): "
+            f"Max retries exceeded with url: /bot{BOT_TOKEN}/sendMessage"
+        )
+        log, stdout = self.run_with_failing_post(
+            lambda: telegram_notifier.send_telegram_message("hello"), error
+        )
+
+        self.assertIn("ConnectionError", log)
+        self.assertNotIn(BOT_TOKEN, log)
+        self.assertNotIn(BOT_TOKEN, stdout)
+
+    def test_http_error(self):
+        log, stdout = self.run_with_failing_post(
+            lambda: telegram_notifier.send_telegram_document("lead.pdf", b"%PDF-1.4"),
+            http_error(503)
+        )
+
+        self.assertIn("HTTPError 503", log)
+        self.assertNotIn(BOT_TOKEN, log)
+        self.assertNotIn(BOT_TOKEN, stdout)
+
+class DescribeErrorTest(unittest.TestCase):
+    def test_type_and_status_only(self):
+        self.assertEqual(retry.describe_error(http_error(429)), "HTTPError 429")
+        self.assertEqual(retry.describe_error(RuntimeError(API_URL)), "RuntimeError")
+
+if __name__ == "__main__":
+    unittest.main()